@@ -1,4 +1,8 @@
 from telebot import TeleBot
-from config import BOT_TOKEN
+from config import BOT_TOKEN, HANDLER_THREADS, HANDLER_QUEUE_LIMIT
+from bot.utils.dispatch import ChatOrderedPool
 
-bot = TeleBot(BOT_TOKEN)
\ No newline at end of file
+# Пул создаём сами: ограниченная очередь, порядок апдейтов внутри одного чата, метрики глубины очереди
+bot = TeleBot(BOT_TOKEN, threaded=False)
+bot.threaded = True
+bot.worker_pool = ChatOrderedPool(bot, num_threads=HANDLER_THREADS, max_pending=HANDLER_QUEUE_LIMIT)
\ No newline at end of file
@@ -4,14 +4,29 @@ from telebot import types
 from bot.core import bot
 from bot.handlers.commands import is_admin
 from bot.utils.api import (
-    api_get_users, api_get_users_page_peek, api_update_user
+    api_get_users, api_update_user, iter_users, refresh_user_stats, user_stats
 )
-from bot.utils.notifications import send_notification_progressively, handle_mass_notification
+from bot.utils.paging import PageSnapshots
+from config import PAGING_SNAPSHOT_TTL
+from bot.utils.notifications import (
+    send_notification_progressively, handle_mass_notification, active_broadcasts, cancel_broadcast,
+    handle_changed_groups_notification
+)
+
+# Снимки списков для пагинации: callback_data вида admin_users:{skip}:{limit}:{snapshot_id}
+page_snapshots = PageSnapshots(PAGING_SNAPSHOT_TTL)
+
+def _snapshot_id(parts: list, index: int = 3):
+    return int(parts[index]) if len(parts) > index and parts[index].isdigit() else None
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("notify_all:") or call.data.startswith("skip_notify:"))
 def _notify_callback(call):
     handle_mass_notification(call)
 
+@bot.callback_query_handler(func=lambda call: call.data == "notify_changed:schedule")
+def _notify_changed_callback(call):
+    handle_changed_groups_notification(call)
+
 def render_admin_panel(chat_id: int, message_id: int | None = None):
     text = "👑 Панель администратора\n\nВыберите действие:"
     kb = types.InlineKeyboardMarkup()
@@ -20,11 +35,33 @@ def render_admin_panel(chat_id: int, message_id: int | None = None):
     kb.add(types.InlineKeyboardButton("📢 Рассылка сообщения", callback_data="admin_broadcast"))
     kb.add(types.InlineKeyboardButton("🔄 Обновить расписание", callback_data="admin_refresh"))
     kb.add(types.InlineKeyboardButton("🔔 Обновить расписание звонков", callback_data="admin_refresh_bell"))
+    for job in active_broadcasts():
+        kb.add(types.InlineKeyboardButton(
+            f"⛔ Остановить рассылку #{job['id']} ({job['context_name']})",
+            callback_data=f"broadcast_cancel:{job['id']}"
+        ))
     if message_id:
         bot.edit_message_text(text, chat_id, message_id, reply_markup=kb)
     else:
         bot.send_message(chat_id, text, reply_markup=kb)
 
+@bot.callback_query_handler(func=lambda call: call.data.startswith("broadcast_cancel:"))
+def broadcast_cancel_handler(call):
+    """Остановка идущей рассылки (кнопка в сообщении с прогрессом или в админ-панели)."""
+    user_id = call.from_user.id
+    if not is_admin(user_id):
+        bot.answer_callback_query(call.id, "❌ У вас нет прав для этого действия")
+        return
+    try:
+        job_id = int(call.data.split(":")[1])
+    except (IndexError, ValueError):
+        bot.answer_callback_query(call.id)
+        return
+    if cancel_broadcast(job_id):
+        bot.answer_callback_query(call.id, f"⛔ Рассылка #{job_id} останавливается...")
+    else:
+        bot.answer_callback_query(call.id, "Рассылка уже завершена.")
+
 @bot.message_handler(commands=['admin'])
 def admin_command(message):
     user_id = int(message.from_user.id)
@@ -64,7 +101,7 @@ def admin_group_stats_handler(call):
     page = int(parts[1]) if len(parts) > 1 else 0
     per_page = int(parts[2]) if len(parts) > 2 else 20
 
-    show_admin_group_stats(call, page=page, per_page=per_page)
+    show_admin_group_stats(call, page=page, per_page=per_page, snapshot_id=_snapshot_id(parts))
     try:
         bot.answer_callback_query(call.id)
     except:
@@ -82,7 +119,7 @@ def admin_teachers_list_handler(call):
     page = int(parts[1]) if len(parts) > 1 else 0
     per_page = int(parts[2]) if len(parts) > 2 else 20
 
-    show_admin_teachers_list(call, page=page, per_page=per_page)
+    show_admin_teachers_list(call, page=page, per_page=per_page, snapshot_id=_snapshot_id(parts))
     try:
         bot.answer_callback_query(call.id)
     except:
@@ -119,7 +156,7 @@ def admin_callback_handler(call):
         parts = call.data.split(":")
         skip = int(parts[1]) if len(parts) > 1 else 0
         limit = int(parts[2]) if len(parts) > 2 else 10
-        show_user_management(call, skip=skip, limit=limit)
+        show_user_management(call, skip=skip, limit=limit, snapshot_id=_snapshot_id(parts))
         return
 
     if call.data == "admin_users":
@@ -144,7 +181,7 @@ def admin_callback_handler(call):
 def process_admin_broadcast(message):
     """Отправляет сообщение всем пользователям через notifications.send_notification_progressively"""
     from bot.utils.notifications import send_notification_progressively
-    from bot.utils.api import api_get_users
+    from bot.utils.api import iter_users
     from bot.handlers.admin import render_admin_panel
 
     admin_id = message.from_user.id
@@ -154,7 +191,7 @@ def process_admin_broadcast(message):
         render_admin_panel(admin_id)
         return
 
-    users = api_get_users()
+    users = iter_users()
     Thread(
         target=send_notification_progressively,
         args=(bot, users, message, admin_id, "manual_broadcast"),
@@ -226,8 +263,8 @@ def handle_mass_notification(call):
         return
 
     bot.answer_callback_query(call.id, f"📢 Начинаю уведомление ({context_name})...")
-    from bot.utils.api import api_get_users
-    users = api_get_users()
+    from bot.utils.api import iter_users
+    users = iter_users()
 
     # текст уведомления можно менять в зависимости от типа
     if context_name == "bell":
@@ -240,39 +277,38 @@ def handle_mass_notification(call):
     # запускаем рассылку в отдельном потоке
     Thread(target=send_notification_progressively, args=(bot, users, msg_text, user_id, context_name)).start()
     
-def show_admin_teachers_list(call, page: int = 0, per_page: int = 20):
+def _teacher_lines() -> tuple:
+    teachers = [u for u in iter_users() if u.get("role") == "teacher"]
+    # сортировка по фамилии
+    teachers.sort(key=lambda u: (u.get("teacher_fio") or "Не указано").lower())
+    return tuple(
+        f"• {t.get('teacher_fio') or 'Не указано'} (ID: {t.get('user_id')}, @{t.get('username') or '—'})"
+        for t in teachers
+    )
+
+def show_admin_teachers_list(call, page: int = 0, per_page: int = 20, snapshot_id: int | None = None):
     """
     Показывает список всех преподавателей с их ФИО и ID.
     - Только пользователи с role == 'teacher'
     - Сортировка по ФИО (алфавитно)
-    - Пагинация
+    - Пагинация по снимку списка, снятому при открытии
     """
     user_id = call.from_user.id
     message_id = call.message.message_id
 
-    users = api_get_users()
-    teachers = [u for u in users if u.get("role") == "teacher"]
+    teachers = page_snapshots.get(user_id, snapshot_id)
+    if teachers is None:
+        teachers = _teacher_lines()
+        snapshot_id = page_snapshots.create(user_id, teachers)
     total_teachers = len(teachers)
 
-    # сортировка по фамилии
-    teachers = sorted(teachers, key=lambda u: (u.get("teacher_fio") or "Не указано").lower())
-
     # пагинация
     page = max(0, int(page))
     per_page = max(5, int(per_page))
     start = page * per_page
     end = start + per_page
-    page_items = teachers[start:end]
-
-    # формирование списка
-    lines = []
-    for t in page_items:
-        fio = t.get("teacher_fio") or "Не указано"
-        uid = t.get("user_id")
-        uname = t.get("username") or "—"
-        lines.append(f"• {fio} (ID: {uid}, @{uname})")
 
-    lines = lines or ["—"]
+    lines = list(teachers[start:end]) or ["—"]
     page_num = page + 1
     page_total = (total_teachers + per_page - 1) // per_page if total_teachers else 1
 
@@ -287,9 +323,9 @@ def show_admin_teachers_list(call, page: int = 0, per_page: int = 20):
     kb = types.InlineKeyboardMarkup(row_width=3)
     nav = []
     if page > 0:
-        nav.append(types.InlineKeyboardButton("⬅️", callback_data=f"admin_teachers_list:{page-1}:{per_page}"))
+        nav.append(types.InlineKeyboardButton("⬅️", callback_data=f"admin_teachers_list:{page-1}:{per_page}:{snapshot_id}"))
     if end < total_teachers:
-        nav.append(types.InlineKeyboardButton("➡️", callback_data=f"admin_teachers_list:{page+1}:{per_page}"))
+        nav.append(types.InlineKeyboardButton("➡️", callback_data=f"admin_teachers_list:{page+1}:{per_page}:{snapshot_id}"))
     if nav:
         kb.add(*nav)
 
@@ -298,7 +334,27 @@ def show_admin_teachers_list(call, page: int = 0, per_page: int = 20):
 
     bot.edit_message_text(text, user_id, message_id, reply_markup=kb)
 
-def show_user_management(call, skip: int = 0, limit: int = 10):
+def _user_management_lines() -> tuple:
+    from config import ROLES
+    # забираем всех пользователей (постранично, без ограничения в 1000)
+    all_users = api_get_users()  # [ {user_id, username, role, ...}, ... ]
+    lines = []
+    # разворачиваем список: новые -> первые
+    for u in reversed(all_users):
+        uid = u.get('user_id')
+        uname = u.get('username')
+        role = u.get('role', 'student')
+        grp = u.get('group_name') or 'нет группы'
+        line = f"@{uname}, {uid}: {ROLES.get(role, role)}"
+        if role == 'student':
+            line += f", группа: {grp}"
+        fio = u.get('teacher_fio')
+        if fio:
+            line += f", ФИО: {fio}"
+        lines.append(line)
+    return tuple(lines)
+
+def show_user_management(call, skip: int = 0, limit: int = 10, snapshot_id: int | None = None):
     user_id = call.from_user.id
     message_id = call.message.message_id
 
@@ -306,35 +362,19 @@ def show_user_management(call, skip: int = 0, limit: int = 10):
     skip = max(0, int(skip))
     limit = max(1, int(limit))
 
-    # 1) забираем всех пользователей (до 1000 с бэка)
-    all_users = api_get_users()  # [ {user_id, username, role, ...}, ... ]
-    # 2) разворачиваем список: новые -> первые
-    users_desc = list(reversed(all_users))
+    # 1) снимок списка: собирается при открытии, дальше листаем его же
+    users_desc = page_snapshots.get(user_id, snapshot_id)
+    if users_desc is None:
+        users_desc = _user_management_lines()
+        snapshot_id = page_snapshots.create(user_id, users_desc)
 
     total = len(users_desc)
-    if total == 0:
-        users_desc = []
     # поправляем skip, чтобы не выйти за границы
     if skip >= total:
         skip = max(0, total - (total % limit or limit))
 
-    # 3) страница
-    page_rows = users_desc[skip: skip + limit]
-
-    from config import ROLES
-    users_info = []
-    for u in page_rows:
-        uid = u.get('user_id')
-        uname = u.get('username')
-        role = u.get('role', 'student')
-        grp = u.get('group_name') or 'нет группы'
-        line = f"@{uname}, {uid}: {ROLES.get(role, role)}"
-        if role == 'student':
-            line += f", группа: {grp}"
-        fio = u.get('teacher_fio')
-        if fio:
-            line += f", ФИО: {fio}"
-        users_info.append(line)
+    # 2) страница
+    users_info = users_desc[skip: skip + limit]
 
     page_num = (skip // limit) + 1
     users_text = "\n".join(users_info) if users_info else "—"
@@ -342,7 +382,7 @@ def show_user_management(call, skip: int = 0, limit: int = 10):
     text = (
         "👥 Управление пользователями\n\n"
         f"Страница: {page_num}\n"
-        f"Показано: {len(page_rows)} из {total}\n\n"
+        f"Показано: {len(users_info)} из {total}\n\n"
         f"{users_text}"
     )
 
@@ -353,9 +393,9 @@ def show_user_management(call, skip: int = 0, limit: int = 10):
     has_next = (skip + limit) < total
     nav_buttons = []
     if has_prev:
-        nav_buttons.append(types.InlineKeyboardButton("⬅️", callback_data=f"admin_users:{skip - limit}:{limit}"))
+        nav_buttons.append(types.InlineKeyboardButton("⬅️", callback_data=f"admin_users:{skip - limit}:{limit}:{snapshot_id}"))
     if has_next:
-        nav_buttons.append(types.InlineKeyboardButton("➡️", callback_data=f"admin_users:{skip + limit}:{limit}"))
+        nav_buttons.append(types.InlineKeyboardButton("➡️", callback_data=f"admin_users:{skip + limit}:{limit}:{snapshot_id}"))
     if nav_buttons:
         kb.add(*nav_buttons)
 
@@ -368,16 +408,18 @@ def show_user_management(call, skip: int = 0, limit: int = 10):
         if "message is not modified" not in str(e):
             raise
 
+def _get_user_stats():
+    # Счётчики ведутся инкрементально; полная выгрузка нужна только до первой сверки
+    if not user_stats.loaded_at:
+        refresh_user_stats()
+    return user_stats
+
 def show_admin_stats(call):
     user_id = call.from_user.id
     message_id = call.message.message_id
-    users = api_get_users()
-    total = len(users)
-    students = sum(1 for u in users if u.get('role') == 'student')
-    teachers = sum(1 for u in users if u.get('role') == 'teacher')
-    admins = sum(1 for u in users if u.get('role') == 'admin')
-    groups = len({u.get('group_name') for u in users if u.get('group_name')})
-    subs = sum(1 for u in users if u.get('schedule_enabled'))
+    stats = _get_user_stats().summary()
+    total, students, teachers = stats["total"], stats["students"], stats["teachers"]
+    admins, groups, subs = stats["admins"], stats["groups"], stats["subs"]
 
     stats_text = (f"📊 Статистика бота\n\n"
                   f"👥 Всего пользователей: {total}\n"
@@ -393,7 +435,7 @@ def show_admin_stats(call):
     bot.edit_message_text(stats_text, user_id, message_id, reply_markup=keyboard)
 
 
-def show_admin_group_stats(call, page: int = 0, per_page: int = 20):
+def show_admin_group_stats(call, page: int = 0, per_page: int = 20, snapshot_id: int | None = None):
     """
     Выводит статистику количества студентов по группам.
     - Считаются только пользователи role == 'student'
@@ -404,32 +446,12 @@ def show_admin_group_stats(call, page: int = 0, per_page: int = 20):
     user_id = call.from_user.id
     message_id = call.message.message_id
 
-    users = api_get_users()
-    from collections import defaultdict
-    groups_count = defaultdict(int)
-    total_students = 0
-
-    # Подсчёт студентов по группам
-    for u in users:
-        if u.get("role") != "student":
-            continue
-        total_students += 1
-        gname = (u.get("group_name") or "").strip()
-        gname = gname if gname else "без группы"
-        groups_count[gname] += 1
-
-    # --- сортировка: сначала "нормальные" группы по числу/алфавиту, потом "без группы" ---
-    import re
-    def sort_key(item):
-        name = item[0]
-        if name == "без группы":
-            return (9999, "ЯЯЯ")  # в самый конец
-        m = re.match(r"(\d+)", name)
-        num = int(m.group(1)) if m else 0
-        letters = re.sub(r"^\d+", "", name)
-        return (num, letters.upper())
-
-    items = sorted(groups_count.items(), key=sort_key)
+    snapshot = page_snapshots.get(user_id, snapshot_id)
+    if snapshot is None:
+        stats = _get_user_stats()
+        snapshot = (tuple(stats.student_groups()), stats.summary()["students"])
+        snapshot_id = page_snapshots.create(user_id, snapshot)
+    items, total_students = snapshot
     total_groups = len(items)
 
     # --- пагинация ---
@@ -456,9 +478,9 @@ def show_admin_group_stats(call, page: int = 0, per_page: int = 20):
     kb = types.InlineKeyboardMarkup(row_width=3)
     nav = []
     if page > 0:
-        nav.append(types.InlineKeyboardButton("⬅️", callback_data=f"admin_group_stats:{page-1}:{per_page}"))
+        nav.append(types.InlineKeyboardButton("⬅️", callback_data=f"admin_group_stats:{page-1}:{per_page}:{snapshot_id}"))
     if end < total_groups:
-        nav.append(types.InlineKeyboardButton("➡️", callback_data=f"admin_group_stats:{page+1}:{per_page}"))
+        nav.append(types.InlineKeyboardButton("➡️", callback_data=f"admin_group_stats:{page+1}:{per_page}:{snapshot_id}"))
     if nav:
         kb.add(*nav)
 
@@ -4,33 +4,26 @@ from bot.core import bot
 from bot.keyboards import create_main_keyboard, group_selection_keyboard
 from bot.messages import welcome_text, settings_text
 from bot.utils.api import (
-    api_get_user, api_update_user, api_create_user, api_get_schedule,
-    api_get_teacher_schedule
+    api_get_user, api_update_user, api_create_user, api_get_schedule
 )
+from bot.utils.teacher_index import get_teacher_schedule
 from bot.utils.schedule_utils import (
-    get_current_day, get_tomorrow_day, format_schedule_for_day, format_teacher_schedule_for_day
+    get_current_day, get_tomorrow_day
 )
+from bot.utils.render_cache import render_schedule_for_day, render_teacher_schedule_for_day
 from bot.utils.fio_utils import fio_full_to_initials, normalize_full_fio, is_valid_full_fio
+from bot.utils.user_context import UserContext, get_user_context
 
-def is_admin(user_id: int) -> bool:
-    u = api_get_user(user_id) or {}
-    role = u.get('role', 'student')
-    if user_id in ADMINS and role != 'admin':
-        api_update_user(user_id, {"role": "admin"})
-        role = 'admin'
-    return role == 'admin'
-
-def is_teacher(user_id: int) -> bool:
-    u = api_get_user(user_id) or {}
-    role = u.get('role', 'student')
-    if user_id in ADMINS and role != 'admin':
-        api_update_user(user_id, {"role": "admin"})
-        role = 'admin'
-    return role in ['teacher', 'admin']
-
-def send_group_selection(user_id: int):
-    kb = group_selection_keyboard(is_admin(user_id), is_teacher(user_id))
-    bot.send_message(user_id, welcome_text(is_admin(user_id), is_teacher(user_id)), reply_markup=kb)
+def is_admin(user_id: int, ctx: UserContext | None = None) -> bool:
+    return (ctx or get_user_context(user_id)).is_admin
+
+def is_teacher(user_id: int, ctx: UserContext | None = None) -> bool:
+    return (ctx or get_user_context(user_id)).is_teacher
+
+def send_group_selection(user_id: int, ctx: UserContext | None = None):
+    ctx = ctx or get_user_context(user_id)
+    kb = group_selection_keyboard(ctx.is_admin, ctx.is_teacher)
+    bot.send_message(user_id, welcome_text(ctx.is_admin, ctx.is_teacher), reply_markup=kb)
 
 @bot.message_handler(commands=['start'])
 def start_command(message):
@@ -66,7 +59,7 @@ def start_command(message):
 
     if user_role in ('teacher', 'admin') and teacher_fio:
         api_update_user(user_id, {"group_name": "Преподаватель"})
-        keyboard = create_main_keyboard(user_id, is_teacher=True, is_admin=is_admin(user_id))
+        keyboard = create_main_keyboard(user_id, is_teacher=True, is_admin=user_role == 'admin')
         bot.send_message(
             user_id,
             f"👨‍🏫 *Мы вас все еще помним, {teacher_fio}!*\n\n"
@@ -77,10 +70,10 @@ def start_command(message):
         return
 
     if not user.get('group_name'):
-        send_group_selection(user_id)
+        send_group_selection(user_id, UserContext(user_id, user))
         return
 
-    keyboard = create_main_keyboard(user_id, is_teacher=False, is_admin=is_admin(user_id))
+    keyboard = create_main_keyboard(user_id, is_teacher=False, is_admin=user_role == 'admin')
     bot.send_message(
         user_id,
         f"👋 Добро пожаловать в бот расписания Салаватского колледжа\n\n"
@@ -105,13 +98,10 @@ def feedback_command(message):
 def process_feedback(message):
     user_id = message.from_user.id
     text = message.text.strip()
-    from bot.utils.api import api_get_user
-    user = api_get_user(user_id) or {}
-    current_group = user.get('group_name') or "не выбрана"
+    ctx = get_user_context(user_id)
+    current_group = ctx.group_name or "не выбрана"
 
-    teacher = is_teacher(user_id)
-    admin = is_admin(user_id)
-    keyboard = create_main_keyboard(user_id, is_teacher=teacher, is_admin=admin)
+    keyboard = create_main_keyboard(user_id, is_teacher=ctx.is_teacher, is_admin=ctx.is_admin)
 
     if text.lower() in ("отмена", "cancel"):
         bot.send_message(user_id, "❌ Отправка отменена.", reply_markup=keyboard)
@@ -139,27 +129,27 @@ def process_feedback(message):
 @bot.message_handler(commands=['schedule'])
 def schedule_command(message):
     user_id = int(message.from_user.id)
-    user = api_get_user(user_id) or {}
+    ctx = get_user_context(user_id)
 
-    if is_teacher(user_id):
-        teacher_fio = user.get('teacher_fio')
+    if ctx.is_teacher:
+        teacher_fio = ctx.teacher_fio
         fio_key = fio_full_to_initials(teacher_fio or '')
         today = get_current_day()
         if not today:
             tomorrow = get_tomorrow_day()
             if tomorrow:
-                sch = api_get_teacher_schedule(fio_key)
-                text = format_teacher_schedule_for_day(teacher_fio or '', sch or {}, tomorrow)
+                sch = get_teacher_schedule(fio_key)
+                text = render_teacher_schedule_for_day(teacher_fio or '', sch or {}, tomorrow)
                 bot.send_message(user_id, f"📅 Сегодня воскресенье! Завтра ({tomorrow}):\n\n{text}")
             else:
                 bot.send_message(user_id, "🎉 Сегодня воскресенье - выходной!")
         else:
-            sch = api_get_teacher_schedule(fio_key)
-            text = format_teacher_schedule_for_day(teacher_fio or '', sch or {}, today)
+            sch = get_teacher_schedule(fio_key)
+            text = render_teacher_schedule_for_day(teacher_fio or '', sch or {}, today)
             bot.send_message(user_id, text)
         return
 
-    group_name = user.get('group_name')
+    group_name = ctx.group_name
     if not group_name:
         bot.send_message(user_id, "❌ Сначала выберите вашу группу с помощью команды /start")
         return
@@ -168,13 +158,13 @@ def schedule_command(message):
         tomorrow = get_tomorrow_day()
         if tomorrow:
             sch = api_get_schedule(group_name)
-            schedule_text = format_schedule_for_day(group_name, sch or {}, tomorrow)
+            schedule_text = render_schedule_for_day(group_name, sch or {}, tomorrow)
             bot.send_message(user_id, f"📅 Сегодня воскресенье! Завтра ({tomorrow}):\n\n{schedule_text}")
         else:
             bot.send_message(user_id, "🎉 Сегодня воскресенье - выходной!")
     else:
         sch = api_get_schedule(group_name)
-        schedule_text = format_schedule_for_day(group_name, sch or {}, today)
+        schedule_text = render_schedule_for_day(group_name, sch or {}, today)
         bot.send_message(user_id, schedule_text, protect_content=True)
 
 @bot.message_handler(commands=['settings'])
@@ -211,10 +201,10 @@ def process_teacher_name(message):
         parse_mode='Markdown'
     )
 
-def render_settings_panel(user_id: int):
-    from bot.utils.api import api_get_user
-    user = api_get_user(user_id) or {}
-    user_role = user.get('role', 'student')
+def render_settings_panel(user_id: int, ctx: UserContext | None = None):
+    ctx = ctx or get_user_context(user_id)
+    user = ctx.user
+    user_role = ctx.role
 
     kb = types.InlineKeyboardMarkup()
     kb.add(types.InlineKeyboardButton("🔄 Сменить группу", callback_data="change_group"))
@@ -227,11 +217,11 @@ def render_settings_panel(user_id: int):
         kb.add(types.InlineKeyboardButton("🔔 Включить ежедневное расписание", callback_data="enable_schedule"))
     kb.add(types.InlineKeyboardButton("⏰ Изменить время отправки", callback_data="change_time"))
 
-    if is_teacher(user_id):
+    if ctx.is_teacher:
         kb.add(types.InlineKeyboardButton("👨‍🏫 Настройки преподавателя", callback_data="teacher_settings"))
 
-    current_group = user.get('group_name') or "не выбрана"
-    teacher_fio = user.get('teacher_fio') if is_teacher(user_id) else None
+    current_group = ctx.group_name or "не выбрана"
+    teacher_fio = ctx.teacher_fio if ctx.is_teacher else None
     text = settings_text(user_role, current_group, enabled, sched_time, teacher_fio)
 
     bot.send_message(user_id, text, reply_markup=kb)
\ No newline at end of file
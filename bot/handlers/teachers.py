@@ -2,9 +2,11 @@ from telebot import types
 from bot.core import bot
 from bot.handlers.commands import is_teacher, is_admin
 from bot.keyboards import group_selection_keyboard
-from bot.utils.api import api_get_user, api_get_teacher_schedule, api_get_users, api_get_all_groups  
+from bot.utils.api import api_get_user, api_get_users_by_group
+from bot.utils.teacher_index import get_teacher_schedule
 from bot.utils.fio_utils import fio_full_to_initials, normalize_full_fio, is_valid_full_fio
 from bot.utils.schedule_utils import get_current_day, format_teacher_schedule_for_day
+from bot.utils.user_context import UserContext, get_user_context
 
 # Служебное состояние: что сейчас выбирает/куда шлёт задания препод
 TEACHER_TARGET_GROUP: dict[int, str] = {}
@@ -13,17 +15,18 @@ TEACHER_SELECTING_GROUP: dict[int, bool] = {}
 @bot.message_handler(commands=['teacher'])
 def teacher_command(message):
     user_id = int(message.from_user.id)
-    if not is_teacher(user_id):
+    ctx = get_user_context(user_id)
+    if not ctx.is_teacher:
         bot.send_message(user_id, "❌ У вас нет прав для доступа к этой команде.")
         return
-    render_teacher_panel(user_id)
+    render_teacher_panel(user_id, ctx=ctx)
 
-def render_teacher_panel(user_id: int, message_id: int | None = None):
+def render_teacher_panel(user_id: int, message_id: int | None = None, ctx: UserContext | None = None):
     text = "👨‍🏫 Панель преподавателя\n\nВыберите действие:"
     kb = types.InlineKeyboardMarkup()
     kb.add(types.InlineKeyboardButton("📚 Мои занятия", callback_data="teacher_lessons"))
     kb.add(types.InlineKeyboardButton("👥 Мои группы", callback_data="teacher_groups"))
-    if is_admin(user_id):
+    if is_admin(user_id, ctx):
         kb.add(types.InlineKeyboardButton("👑 Перейти в админ-панель", callback_data="admin_panel"))
     if message_id:
         bot.edit_message_text(text, user_id, message_id, reply_markup=kb)
@@ -33,7 +36,8 @@ def render_teacher_panel(user_id: int, message_id: int | None = None):
 @bot.callback_query_handler(func=lambda call: call.data.startswith('teacher_'))
 def teacher_callback_handler(call):
     user_id = call.from_user.id
-    if not is_teacher(user_id):
+    ctx = get_user_context(user_id)
+    if not ctx.is_teacher:
         bot.answer_callback_query(call.id, "❌ У вас нет прав для этого действия")
         return
 
@@ -42,8 +46,7 @@ def teacher_callback_handler(call):
             bot.clear_step_handler_by_chat_id(call.from_user.id)
         except Exception:
             pass
-        user = api_get_user(user_id) or {}
-        teacher_fio = user.get("teacher_fio", "Не указано")
+        teacher_fio = ctx.user.get("teacher_fio", "Не указано")
         fio_key = fio_full_to_initials(teacher_fio)
         today = get_current_day()
 
@@ -52,16 +55,17 @@ def teacher_callback_handler(call):
             bot.send_message(user_id, "🎉 Сегодня воскресенье — занятий нет.")
             return
 
-        sch = api_get_teacher_schedule(fio_key) or {}
+        sch = get_teacher_schedule(fio_key) or {}
         schedule = sch.get("schedule", {})
 
         groups = set()
         for _, shift_data in schedule.items():
             day_lessons = shift_data.get(today, {})
             for _, info in day_lessons.items():
-                group = info.get("group")
-                if group:
-                    groups.add(group)
+                # Пара-поток из индекса — несколько групп, каждой своя кнопка
+                for group in info.get("groups") or [info.get("group")]:
+                    if group:
+                        groups.add(group)
 
         kb = types.InlineKeyboardMarkup(row_width=2)
         if groups:
@@ -130,7 +134,7 @@ def teacher_callback_handler(call):
         return
 
     elif call.data == "teacher_settings":
-        show_teacher_settings(call)
+        show_teacher_settings(call, ctx)
         bot.answer_callback_query(call.id)
         return
     
@@ -151,7 +155,7 @@ def teacher_callback_handler(call):
         return
 
     elif call.data == "teacher_back":
-        render_teacher_panel(user_id, message_id=call.message.message_id)
+        render_teacher_panel(user_id, message_id=call.message.message_id, ctx=ctx)
         bot.answer_callback_query(call.id)
         return
 
@@ -169,10 +173,10 @@ def teacher_callback_handler(call):
         bot.answer_callback_query(call.id)
         return
 
-def show_teacher_settings(call):
+def show_teacher_settings(call, ctx: UserContext | None = None):
     user_id = call.from_user.id
-    from bot.utils.api import api_get_user
-    teacher_fio = (api_get_user(user_id) or {}).get('teacher_fio') or "Не указано"
+    ctx = ctx or get_user_context(user_id)
+    teacher_fio = ctx.teacher_fio or "Не указано"
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(types.InlineKeyboardButton("✏️ Изменить ФИО", callback_data="teacher_change_fio"))
     keyboard.add(types.InlineKeyboardButton("⬅️ Назад", callback_data="settings_back"))
@@ -219,7 +223,7 @@ def process_teacher_task_file(message, group_name):
         bot.register_next_step_handler(msg, lambda m: process_teacher_task_file(m, group_name))
         return
 
-    users = [u for u in api_get_users() if u.get("group_name") == group_name]
+    users = api_get_users_by_group(group_name)
     count_sent = 0
 
     if message.content_type == "document":
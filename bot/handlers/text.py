@@ -1,28 +1,76 @@
 from telebot import types
 from bot.core import bot
-from bot.handlers.commands import is_teacher, is_admin, render_settings_panel
+from bot.handlers.commands import render_settings_panel
 from bot.utils.api import (
-    api_get_user, api_get_users, api_update_user, api_get_schedule, api_upload_schedule, api_get_all_groups, api_get_teacher_schedule
+    api_get_users_by_group, api_update_user, api_get_schedule, api_upload_schedule, api_get_group_catalogue
 )
+from bot.utils.teacher_index import get_teacher_schedule
 from bot.utils.schedule_utils import (
-    get_current_day, get_tomorrow_day, format_schedule_for_day, format_teacher_schedule_for_day
+    get_current_day, get_tomorrow_day
 )
+from bot.utils.render_cache import render_schedule_for_day, render_teacher_schedule_for_day
+from bot.utils.warmup import start_schedule_warmup
+from bot.utils.docx_schedule import parse_schedule_docx, diff_against_current, format_diff_preview
+from bot.utils.notifications import changed_schedule_groups, schedule_snapshots
+from bot.utils.change_detect import take_schedule_snapshot
+from bot.utils.logger import log_error
 from bot.utils.fio_utils import fio_full_to_initials
 from bot.keyboards import create_main_keyboard
 from bot.handlers.teachers import TEACHER_TARGET_GROUP, TEACHER_SELECTING_GROUP
+from bot.utils.user_context import get_user_context
 
-pending_uploads = {}  # user_id → {"docx": bytes, "json": bytes}
+pending_uploads = {}  # user_id → {"docx": bytes, "json": bytes, "affected": [группы с изменениями]}
+
+def _preview_schedule_docx(user_id: int, docx_bytes: bytes):
+    """Разбирает DOCX локально и показывает админу, какие группы изменятся после загрузки."""
+    try:
+        parsed = parse_schedule_docx(docx_bytes)
+    except Exception as e:
+        log_error("parse_schedule_docx()", e)
+        bot.send_message(user_id, "⚠️ Не удалось разобрать файл для предпросмотра — загрузить его всё равно можно.")
+        return
+    if not parsed:
+        bot.send_message(user_id, "⚠️ В файле не найдено ни одной таблицы расписания группы — проверьте, тот ли это файл.")
+        return
+    diff = diff_against_current(parsed)
+    pending_uploads.setdefault(user_id, {})['affected'] = diff.affected_groups
+    bot.send_message(user_id, format_diff_preview(diff))
+
+def _snapshot_before_upload():
+    try:
+        return take_schedule_snapshot()
+    except Exception as e:
+        log_error("take_schedule_snapshot()", e)
+        return None
+
+def _schedule_notify_keyboard(user_id: int, data: dict) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup()
+    affected = data.get('affected')
+    before = data.get('before')
+    if affected is not None:
+        changed_schedule_groups[user_id] = affected
+    if before is not None:
+        schedule_snapshots[user_id] = before
+    if affected or before is not None:
+        label = f"🎯 Только изменённые ({len(affected)} гр. по файлу)" if affected else "🎯 Только изменённые группы"
+        kb.add(types.InlineKeyboardButton(label, callback_data="notify_changed:schedule"))
+    kb.add(
+        types.InlineKeyboardButton("✅ Да, уведомить всех", callback_data="notify_all:schedule"),
+        types.InlineKeyboardButton("🚫 Нет, не уведомлять", callback_data="skip_notify:schedule")
+    )
+    return kb
 
 @bot.message_handler(func=lambda message: True, content_types=['text', 'document', 'photo'])
 def text_message_handler(message):
     user_id = int(message.from_user.id)
+    # Пользователь запрашивается один раз на весь апдейт
+    ctx = get_user_context(user_id)
 
     # ==== 0) Преподаватель уже выбрал целевую группу — ловим ЛЮБОЕ сообщение и рассылаем ====
-    if is_teacher(user_id) and TEACHER_TARGET_GROUP.get(user_id):
+    if ctx.is_teacher and TEACHER_TARGET_GROUP.get(user_id):
         target_group = TEACHER_TARGET_GROUP[user_id]
-        user = api_get_user(user_id) or {}
-        teacher_fio = user.get("teacher_fio", "Неизвестно")
-        students = [u for u in api_get_users() if u.get("group_name") == target_group]
+        teacher_fio = ctx.user.get("teacher_fio", "Неизвестно")
+        students = api_get_users_by_group(target_group)
 
         sent = 0
         # ТОЛЬКО ТЕКСТ
@@ -83,8 +131,7 @@ def text_message_handler(message):
 
     # ==== 1) Админская загрузка DOCX/JSON ====
     if message.content_type == 'document':
-        user = api_get_user(user_id) or {}
-        if user.get('role') != 'admin':
+        if not ctx.is_admin:
             bot.send_message(user_id, "❌ У вас нет прав для загрузки файлов.")
             return
         file_info = bot.get_file(message.document.file_id)
@@ -116,6 +163,8 @@ def text_message_handler(message):
 
         elif fname.endswith('.docx'):
             pending_uploads[user_id]['docx'] = file_bytes
+            pending_uploads[user_id].pop('affected', None)
+            _preview_schedule_docx(user_id, file_bytes)
             if 'json' in pending_uploads[user_id]:
                 markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
                 markup.add(types.KeyboardButton("📤 Загрузить оба файла"))
@@ -153,9 +202,9 @@ def text_message_handler(message):
     # ==== 2) Обычные текстовые кнопки ====
     text = (message.text or '').strip()
 
-    if text == "⏩ Пропустить" and is_admin(user_id):
+    if text == "⏩ Пропустить" and ctx.is_admin:
         api_update_user(user_id, {"group_name": "Админ"})
-        keyboard = create_main_keyboard(user_id, is_teacher=is_teacher(user_id), is_admin=is_admin(user_id))
+        keyboard = create_main_keyboard(user_id, is_teacher=ctx.is_teacher, is_admin=ctx.is_admin)
         bot.send_message(
             user_id,
             "✅ Регистрация завершена!\n"
@@ -166,8 +215,8 @@ def text_message_handler(message):
         return
 
     # ---- 2.a) Преподаватель в режиме выбора «Другая группа» — ловим нажатие группы с клавиатуры ----
-    if is_teacher(user_id) and TEACHER_SELECTING_GROUP.get(user_id):
-        groups = set(api_get_all_groups())
+    groups = api_get_group_catalogue()
+    if ctx.is_teacher and TEACHER_SELECTING_GROUP.get(user_id):
         if text in groups:
             TEACHER_SELECTING_GROUP[user_id] = False
             TEACHER_TARGET_GROUP[user_id] = text
@@ -187,16 +236,16 @@ def text_message_handler(message):
         # если нажали не группу — падаем в обычную логику ниже
 
     # ---- 2.b) Выбор группы (обычный сценарий для студента) ----
-    if text in set(api_get_all_groups()):
-        if is_teacher(user_id):
+    if text in groups:
+        if ctx.is_teacher:
             # Для преподавателя при обычном нажатии покажем расписание группы
             group_name = text
             sch = api_get_schedule(group_name)
-            schedule_text = format_schedule_for_day(group_name, sch or {}, get_current_day() or "Понедельник")
+            schedule_text = render_schedule_for_day(group_name, sch or {}, get_current_day() or "Понедельник")
             bot.send_message(user_id, schedule_text)
             return
         api_update_user(user_id, {'role': 'student', 'group_name': text})
-        keyboard = create_main_keyboard(user_id, is_teacher=False, is_admin=is_admin(user_id))
+        keyboard = create_main_keyboard(user_id, is_teacher=False, is_admin=ctx.is_admin)
         bot.send_message(
             user_id,
             f"✅ Группа {text} установлена!\n"
@@ -212,35 +261,34 @@ def text_message_handler(message):
         )
         return
 
-    if text == "👑 Админ панель" and is_admin(user_id):
+    if text == "👑 Админ панель" and ctx.is_admin:
         from bot.handlers.admin import admin_command
         admin_command(message)
         return
 
-    if text == "👨‍🏫 Панель преподавателя" and is_teacher(user_id):
+    if text == "👨‍🏫 Панель преподавателя" and ctx.is_teacher:
         from bot.handlers.teachers import teacher_command
         teacher_command(message)
         return
 
     if text == "📅 Сегодня":
-        if is_teacher(user_id):
-            teacher_fio = (api_get_user(user_id) or {}).get('teacher_fio')
+        if ctx.is_teacher:
+            teacher_fio = ctx.teacher_fio
             today = get_current_day()
             fio_key = fio_full_to_initials(teacher_fio or '')
             if not today:
                 tomorrow = get_tomorrow_day()
                 if tomorrow:
-                    sch = api_get_schedule((api_get_user(user_id) or {}).get('group_name',''))
-                    t = format_teacher_schedule_for_day(teacher_fio or '', api_get_teacher_schedule(fio_key) or {}, tomorrow)
+                    t = render_teacher_schedule_for_day(teacher_fio or '', get_teacher_schedule(fio_key) or {}, tomorrow)
                     bot.send_message(user_id, f"📅 Сегодня воскресенье! Завтра ({tomorrow}):\n\n{t}")
                 else:
                     bot.send_message(user_id, "🎉 Сегодня воскресенье - выходной!")
             else:
-                sch = api_get_teacher_schedule(fio_key)
-                t = format_teacher_schedule_for_day(teacher_fio or '', sch or {}, today)
+                sch = get_teacher_schedule(fio_key)
+                t = render_teacher_schedule_for_day(teacher_fio or '', sch or {}, today)
                 bot.send_message(user_id, t)
             return
-        group_name = (api_get_user(user_id) or {}).get('group_name')
+        group_name = ctx.group_name
         if not group_name:
             bot.send_message(user_id, "❌ Сначала выберите вашу группу с помощью команды /start")
             return
@@ -249,13 +297,13 @@ def text_message_handler(message):
             tomorrow = get_tomorrow_day()
             if tomorrow:
                 sch = api_get_schedule(group_name)
-                schedule_text = format_schedule_for_day(group_name, sch or {}, tomorrow)
+                schedule_text = render_schedule_for_day(group_name, sch or {}, tomorrow)
                 bot.send_message(user_id, f"📅 Сегодня воскресенье! Завтра ({tomorrow}):\n\n{schedule_text}")
             else:
                 bot.send_message(user_id, "🎉 Сегодня воскресенье - выходной!")
         else:
             sch = api_get_schedule(group_name)
-            schedule_text = format_schedule_for_day(group_name, sch or {}, today)
+            schedule_text = render_schedule_for_day(group_name, sch or {}, today)
             bot.send_message(user_id, schedule_text, protect_content=True)
         return
     
@@ -268,7 +316,7 @@ def text_message_handler(message):
         return
 
     if text == "⚙️ Настройки":
-        render_settings_panel(message.from_user.id)
+        render_settings_panel(user_id, ctx)
         return
 
     if text in ["📅 ПН", "📅 ВТ", "📅 СР", "📅 ЧТ", "📅 ПТ", "📅 СБ"]:
@@ -281,27 +329,26 @@ def text_message_handler(message):
             "📅 СБ": "Суббота"
         }
         day = day_map[text]
-        if is_teacher(user_id):
-            teacher_fio = (api_get_user(user_id) or {}).get('teacher_fio')
+        if ctx.is_teacher:
+            teacher_fio = ctx.teacher_fio
             fio_key = fio_full_to_initials(teacher_fio or '')
-            sch = api_get_teacher_schedule(fio_key)
-            t = format_teacher_schedule_for_day(teacher_fio or '', sch or {}, day)
+            sch = get_teacher_schedule(fio_key)
+            t = render_teacher_schedule_for_day(teacher_fio or '', sch or {}, day)
             bot.send_message(user_id, t)
             return
-        group_name = (api_get_user(user_id) or {}).get('group_name')
+        group_name = ctx.group_name
         if not group_name:
             bot.send_message(user_id, "❌ Сначала выберите вашу группу с помощью команды /start")
             return
         sch = api_get_schedule(group_name)
-        schedule_text = format_schedule_for_day(group_name, sch or {}, day)
+        schedule_text = render_schedule_for_day(group_name, sch or {}, day)
         bot.send_message(user_id, schedule_text, protect_content=True)
         return
 
     if text == "❌ Отмена":
         pending_uploads.pop(user_id, None)
-        group_name = (api_get_user(user_id) or {}).get('group_name')
-        if group_name:
-            keyboard = create_main_keyboard(user_id, is_teacher=is_teacher(user_id), is_admin=is_admin(user_id))
+        if ctx.group_name:
+            keyboard = create_main_keyboard(user_id, is_teacher=ctx.is_teacher, is_admin=ctx.is_admin)
             bot.send_message(user_id, "Действие отменено.", reply_markup=keyboard)
         else:
             bot.send_message(user_id, "Действие отменено. Используйте /start для выбора группы.")
@@ -315,25 +362,18 @@ def text_message_handler(message):
 
         bot.send_message(user_id, "⏳ Отправка расписания на сервер...")
 
+        # Хэши расписаний групп до загрузки — по ним потом определяем, кого уведомлять
+        data['before'] = _snapshot_before_upload()
         resp = api_upload_schedule(data['docx'], None)
         pending_uploads.pop(user_id, None)
 
-        keyboard = create_main_keyboard(user_id, is_teacher=is_teacher(user_id), is_admin=is_admin(user_id))
+        keyboard = create_main_keyboard(user_id, is_teacher=ctx.is_teacher, is_admin=ctx.is_admin)
 
         if resp is not None:
+            # Кэш расписаний сброшен загрузкой — в фоне скачиваем и рендерим все группы и преподавателей
+            start_schedule_warmup(bot, user_id)
             msg_text = "✅ Расписание успешно обновлено!\n\n📣 Уведомить всех пользователей о новых расписаниях?"
-            kb = types.InlineKeyboardMarkup()
-            kb.add(
-                types.InlineKeyboardButton("✅ Да, уведомить всех", callback_data="notify_all:schedule"),
-                types.InlineKeyboardButton("🚫 Нет, не уведомлять", callback_data="skip_notify:schedule")
-            )
-            bot.send_message(user_id, msg_text, reply_markup=kb)
-
-            keyboard = create_main_keyboard(
-                user_id,
-                is_teacher=is_teacher(user_id),
-                is_admin=is_admin(user_id)
-            )
+            bot.send_message(user_id, msg_text, reply_markup=_schedule_notify_keyboard(user_id, data))
 
             bot.send_message(
                 user_id,
@@ -352,25 +392,18 @@ def text_message_handler(message):
 
         bot.send_message(user_id, "⏳ Отправка файлов на сервер...")
 
+        # Хэши расписаний групп до загрузки — по ним потом определяем, кого уведомлять
+        data['before'] = _snapshot_before_upload()
         resp = api_upload_schedule(data['docx'], data.get('json'))
         pending_uploads.pop(user_id, None)
 
-        keyboard = create_main_keyboard(user_id, is_teacher=is_teacher(user_id), is_admin=is_admin(user_id))
+        keyboard = create_main_keyboard(user_id, is_teacher=ctx.is_teacher, is_admin=ctx.is_admin)
 
         if resp is not None:
+            # Кэш расписаний сброшен загрузкой — в фоне скачиваем и рендерим все группы и преподавателей
+            start_schedule_warmup(bot, user_id)
             msg_text = "✅ Расписание успешно обновлено!\n\n📣 Уведомить всех пользователей о новых расписаниях?"
-            kb = types.InlineKeyboardMarkup()
-            kb.add(
-                types.InlineKeyboardButton("✅ Да, уведомить всех", callback_data="notify_all:schedule"),
-                types.InlineKeyboardButton("🚫 Нет, не уведомлять", callback_data="skip_notify:schedule")
-            )
-            bot.send_message(user_id, msg_text, reply_markup=kb)
-
-            keyboard = create_main_keyboard(
-                user_id,
-                is_teacher=is_teacher(user_id),
-                is_admin=is_admin(user_id)
-            )
+            bot.send_message(user_id, msg_text, reply_markup=_schedule_notify_keyboard(user_id, data))
 
             bot.send_message(
                 user_id,
@@ -1,11 +1,26 @@
+from functools import lru_cache
+from threading import Lock
 from telebot import types
 from config import ROLES
-from .utils.api import api_get_all_groups
+from .utils.api import api_get_group_catalogue
 from .utils.schedule_utils import get_current_day
 from .utils.fio_utils import fio_full_to_initials
 from .utils.api import api_get_teacher_schedule
 
-def create_main_keyboard(user_id: int, is_teacher: bool, is_admin: bool) -> types.ReplyKeyboardMarkup:
+class FrozenKeyboard(types.JsonSerializable):
+    """
+    Клавиатура, сериализованная в JSON один раз.
+    TeleBot принимает любой JsonSerializable в reply_markup, так что её можно отправлять повторно без пересборки.
+    """
+
+    def __init__(self, markup: types.JsonSerializable):
+        self._json = markup.to_json()
+
+    def to_json(self) -> str:
+        return self._json
+
+@lru_cache(maxsize=None)
+def _main_keyboard(is_teacher: bool, is_admin: bool) -> FrozenKeyboard:
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=3)
     keyboard.add(types.KeyboardButton("🔗 Мы в ВК"), types.KeyboardButton("📅 Сегодня"), types.KeyboardButton("⚙️ Настройки"))
     keyboard.add(types.KeyboardButton("📅 ПН"), types.KeyboardButton("📅 ВТ"), types.KeyboardButton("📅 СР"))
@@ -16,10 +31,16 @@ def create_main_keyboard(user_id: int, is_teacher: bool, is_admin: bool) -> type
         keyboard.add(types.KeyboardButton("👨‍🏫 Панель преподавателя"))
     if is_admin:
         keyboard.add(types.KeyboardButton("👑 Админ панель"))
-    return keyboard
+    return FrozenKeyboard(keyboard)
+
+def create_main_keyboard(user_id: int, is_teacher: bool, is_admin: bool) -> FrozenKeyboard:
+    return _main_keyboard(bool(is_teacher), bool(is_admin))
 
-def group_selection_keyboard(is_admin: bool, is_teacher: bool) -> types.ReplyKeyboardMarkup:
-    groups = api_get_all_groups()
+# (revision каталога групп, is_admin, is_teacher) → клавиатура выбора группы
+_group_keyboards: dict[tuple[int, bool, bool], FrozenKeyboard] = {}
+_group_keyboards_lock = Lock()
+
+def _build_group_selection_keyboard(groups, is_admin: bool, is_teacher: bool) -> FrozenKeyboard:
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     if is_admin:
         keyboard.add(types.KeyboardButton("⏩ Пропустить"))
@@ -29,4 +50,26 @@ def group_selection_keyboard(is_admin: bool, is_teacher: bool) -> types.ReplyKey
     if not is_teacher:
         keyboard.add(types.KeyboardButton("💬 Обратная связь"))
     keyboard.add(types.KeyboardButton("❌ Отмена"))
-    return keyboard
\ No newline at end of file
+    return FrozenKeyboard(keyboard)
+
+def group_selection_keyboard(is_admin: bool, is_teacher: bool) -> FrozenKeyboard:
+    catalogue = api_get_group_catalogue()
+    is_admin, is_teacher = bool(is_admin), bool(is_teacher)
+    if not catalogue.groups:
+        # Список групп не получен — не запоминаем пустую клавиатуру
+        return _build_group_selection_keyboard((), is_admin, is_teacher)
+
+    key = (catalogue.revision, is_admin, is_teacher)
+    keyboard = _group_keyboards.get(key)
+    if keyboard is not None:
+        return keyboard
+    with _group_keyboards_lock:
+        if catalogue.revision not in {k[0] for k in _group_keyboards}:
+            # Каталог групп изменился — все четыре варианта строим заново
+            _group_keyboards.clear()
+            for admin in (False, True):
+                for teacher in (False, True):
+                    _group_keyboards[(catalogue.revision, admin, teacher)] = _build_group_selection_keyboard(
+                        catalogue.groups, admin, teacher
+                    )
+        return _group_keyboards[key]
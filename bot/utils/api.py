@@ -1,41 +1,277 @@
-from typing import Any, Dict, List, Optional, Tuple
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from requests.adapters import HTTPAdapter, Retry
 import requests
-from config import API_URL, PLATFORM
+from threading import Lock
+from config import (
+    API_URL, PLATFORM, USER_CACHE_TTL, SCHEDULE_CACHE_TTL, SCHEDULE_CACHE_SIZE, GROUPS_CACHE_TTL, USER_INDEX_TTL,
+    USERS_PAGE_SIZE, SCHEDULE_STALE_TTL, API_CONNECT_TIMEOUT, API_READ_TIMEOUT, API_BREAKER_FAILURES,
+    API_BREAKER_RESET
+)
 from .logger import log_error
+from .cache import TTLCache
+from .user_index import UserIndex, user_matches
+from .user_stats import UserStats
+from .subscriber_index import SubscriberIndex
+from .single_flight import SingleFlight
+from .circuit_breaker import CircuitBreaker
 
 session = requests.Session()
 retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
 session.mount("http://", HTTPAdapter(max_retries=retries))
 session.mount("https://", HTTPAdapter(max_retries=retries))
 
+# Чтение — отдельная сессия с коротким таймаутом и одним повтором: пока размыкатель
+# набирает сбои, каждый GET ждёт не больше ~2 × API_READ_TIMEOUT, а не 4 × 15 с
+read_session = requests.Session()
+read_retries = Retry(total=1, backoff_factor=0.2, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+read_session.mount("http://", HTTPAdapter(max_retries=read_retries))
+read_session.mount("https://", HTTPAdapter(max_retries=read_retries))
+
+class ApiUnavailable(Exception):
+    pass
+
+class CircuitOpen(ApiUnavailable):
+    pass
+
+# Пока бэкенд лежит, запросы не ждут таймаутов с ретраями, а сразу получают CircuitOpen
+breaker = CircuitBreaker(API_BREAKER_FAILURES, API_BREAKER_RESET, name="API")
+
+def _request(http: requests.Session, method: str, url: str, read_timeout: float, **kwargs):
+    if not breaker.allow():
+        raise CircuitOpen(url.replace(API_URL, ""))
+    ok = False
+    try:
+        r = http.request(method, url, timeout=(API_CONNECT_TIMEOUT, read_timeout), **kwargs)
+        ok = r.status_code < 500
+        return r
+    finally:
+        # Любой исход, включая неожиданное исключение, освобождает пробный запрос полуоткрытой цепи
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
 def _get(url, **kwargs):
-    return session.get(url, timeout=15, **kwargs)
+    return _request(read_session, "GET", url, API_READ_TIMEOUT, **kwargs)
 
 def _post(url, **kwargs):
-    return session.post(url, timeout=30, **kwargs)
+    return _request(session, "POST", url, 30, **kwargs)
 
 def _put(url, **kwargs):
-    return session.put(url, timeout=30, **kwargs)
+    return _request(session, "PUT", url, 30, **kwargs)
 
-def api_get_user(user_id: int, platform: str = PLATFORM) -> Optional[Dict[str, Any]]:
+# Одинаковые одновременные GET (например, вся группа жмёт «Сегодня» после пары)
+# делят один HTTP-запрос и один разобранный ответ
+_inflight = SingleFlight(name="api-get")
+
+def _request_key(url: str, params: Optional[Dict[str, Any]]) -> Tuple[str, tuple]:
+    return url.replace(API_URL, ""), tuple(sorted((params or {}).items()))
+
+# Валидаторы условных GET: (путь, параметры) → (ETag, Last-Modified, разобранный ответ).
+# На 304 повторно используется уже разобранный объект — без скачивания и json-декодирования
+_validators = TTLCache(SCHEDULE_STALE_TTL, maxsize=SCHEDULE_CACHE_SIZE * 2, name="validators")
+
+def _conditional_headers(vkey: Tuple[str, tuple]) -> Dict[str, str]:
+    known = _validators.get(vkey)
+    if known is None:
+        return {}
+    etag, last_modified, _data = known
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+def _fetch_json(url: str, context: str, params: Optional[Dict[str, Any]] = None, conditional: bool = False) -> Any:
+    """None — ответ не 200; ApiUnavailable — бэкенд не ответил, ответил 5xx или цепь разомкнута."""
+    kwargs: Dict[str, Any] = {}
+    if params is not None:
+        kwargs["params"] = params
+    vkey = _request_key(url, params)
+    if conditional:
+        headers = _conditional_headers(vkey)
+        if headers:
+            kwargs["headers"] = headers
     try:
-        # Эндпоинт включает динамическую платформу[cite: 9]
-        r = _get(f"{API_URL}/users/{platform}/{user_id}")
-        if r.status_code == 200:
-            return r.json()
-        print(f"[WARN] GET /users/{platform}/{user_id} → {r.status_code}: {r.text[:200]}")
+        r = _get(url, **kwargs)
+    except CircuitOpen:
+        raise
     except Exception as e:
-        log_error(f"api_get_user({user_id}, {platform})", e)
+        log_error(context, e)
+        raise ApiUnavailable(context) from e
+    if r.status_code == 304 and conditional:
+        known = _validators.get(vkey)
+        if known is not None:
+            _validators.set(vkey, known)
+            return known[2]
+        # Валидатор успели вытеснить — запрашиваем документ целиком
+        return _fetch_json(url, context, params)
+    if r.status_code == 200:
+        try:
+            data = r.json()
+        except ValueError as e:
+            # Битое тело ответа — как недоступный бэкенд: вызывающий отдаст кэш или None
+            log_error(f"{context}: некорректный JSON", e)
+            raise ApiUnavailable(context) from e
+        if conditional:
+            etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+            if etag or last_modified:
+                _validators.set(vkey, (etag, last_modified, data))
+            else:
+                _validators.pop(vkey)
+        return data
+    query = "?" + "&".join(f"{k}={v}" for k, v in params.items()) if params else ""
+    print(f"[WARN] GET {url.replace(API_URL, '')}{query} → {r.status_code}: {r.text[:200]}")
+    if r.status_code >= 500:
+        raise ApiUnavailable(context)
     return None
 
+def _get_json(url: str, context: str, params: Optional[Dict[str, Any]] = None, key: Any = None,
+              raise_unavailable: bool = False, conditional: bool = False) -> Any:
+    """
+    GET с разбором JSON; None — ошибка или не 200. Одновременные вызовы с одним ключом склеиваются.
+    conditional=True — запрос с If-None-Match/If-Modified-Since по валидаторам прошлого ответа.
+    """
+    if key is None:
+        key = _request_key(url, params)
+    try:
+        return _inflight.do(key, lambda: _fetch_json(url, context, params, conditional))
+    except ApiUnavailable:
+        if raise_unavailable:
+            raise
+        return None
+
+# Кэш пользователей: один и тот же апдейт и соседние апдейты не ходят в API повторно
+_user_cache = TTLCache(USER_CACHE_TTL, name="users")
+
+# Локальный индекс пользователей — запасной вариант для выборок, если бэкенд не фильтрует сам
+_user_index = UserIndex()
+user_stats = UserStats()
+subscriber_index = SubscriberIndex()
+
+_server_filters_supported: Optional[bool] = None
+
+def _cache_user(user_id: int, platform: str, user: Optional[Dict[str, Any]]):
+    if isinstance(user, dict) and user.get("user_id") is not None:
+        _user_cache.set((platform, int(user_id)), user)
+        if platform == PLATFORM:
+            if _user_index.loaded_at:
+                _user_index.upsert(user)
+            user_stats.apply(user)
+            subscriber_index.apply(user)
+    else:
+        _user_cache.pop((platform, int(user_id)))
+
+def invalidate_user_cache(user_id: int | None = None, platform: str = PLATFORM):
+    if user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop((platform, int(user_id)))
+
+# Кэш расписаний групп и преподавателей. Расписание меняется только при загрузке нового DOCX,
+# поэтому после успешной загрузки кэш сбрасывается и версия расписания увеличивается.
+_schedule_cache = TTLCache(SCHEDULE_CACHE_TTL, maxsize=SCHEDULE_CACHE_SIZE, name="schedules")
+_schedule_version = 0
+_schedule_version_lock = Lock()
+
+def schedule_version() -> int:
+    return _schedule_version
+
+def invalidate_schedule_cache():
+    global _schedule_version
+    with _schedule_version_lock:
+        _schedule_version += 1
+        _schedule_cache.clear()
+    invalidate_group_catalogue()
+
+# Последние удачные ответы: (версия, расписание). Загрузкой не сбрасываются —
+# при недоступном API лучше показать прошлое расписание, чем «не найдено»
+_stale_schedules = TTLCache(SCHEDULE_STALE_TTL, maxsize=SCHEDULE_CACHE_SIZE, name="schedules-stale")
+_revalidating: set = set()
+_revalidate_lock = Lock()
+_revalidate_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="api-revalidate")
+
+def schedule_cache_stats() -> Dict[str, Any]:
+    return {**_schedule_cache.stats(), "version": _schedule_version, "stale": _stale_schedules.stats()}
+
+def api_health_stats() -> Dict[str, Any]:
+    return {
+        "breaker": breaker.stats(),
+        "single_flight": _inflight.stats(),
+        "schedules": schedule_cache_stats(),
+        "validators": _validators.stats(),
+    }
+
+def _store_schedule(key: Tuple[str, str], data: Any, version: int):
+    # Не кладём в кэш ответ, полученный до загрузки нового расписания
+    with _schedule_version_lock:
+        if version == _schedule_version:
+            _schedule_cache.set(key, data)
+            _stale_schedules.set(key, (version, data))
+
+def _fetch_schedule(key: Tuple[str, str], url: str, context: str, version: int) -> Optional[Dict[str, Any]]:
+    # Версия в ключе: запрос, начатый до загрузки нового расписания, не склеивается с запросами после неё
+    data = _get_json(url, context, key=(url.replace(API_URL, ""), version), raise_unavailable=True, conditional=True)
+    if data is not None:
+        _store_schedule(key, data, version)
+    return data
+
+def _revalidate_schedule(key: Tuple[str, str], url: str, context: str, version: int):
+    try:
+        _fetch_schedule(key, url, context, version)
+    except ApiUnavailable:
+        pass
+    except Exception as e:
+        log_error(f"revalidate {context}", e)
+    finally:
+        with _revalidate_lock:
+            _revalidating.discard(key)
+
+def _cached_schedule_get(key: Tuple[str, str], url: str, context: str) -> Optional[Dict[str, Any]]:
+    cached = _schedule_cache.get(key)
+    if cached is not None:
+        return cached
+    version = _schedule_version
+    stale = _stale_schedules.get(key)
+    if stale is not None and stale[0] == version:
+        # Срок истёк, но расписание с тех пор не загружали: отдаём сразу, обновляем в фоне
+        with _revalidate_lock:
+            start = key not in _revalidating
+            _revalidating.add(key)
+        if start:
+            _revalidate_pool.submit(_revalidate_schedule, key, url, context, version)
+        return stale[1]
+    try:
+        return _fetch_schedule(key, url, context, version)
+    except ApiUnavailable:
+        if stale is not None:
+            print(f"[WARN] API недоступно, отдаём последнее известное расписание: {key[1]}")
+            return stale[1]
+        return None
+
+def api_get_user(user_id: int, platform: str = PLATFORM) -> Optional[Dict[str, Any]]:
+    cached = _user_cache.get((platform, int(user_id)))
+    if cached is not None:
+        return dict(cached)
+    # Эндпоинт включает динамическую платформу[cite: 9]
+    user = _get_json(f"{API_URL}/users/{platform}/{user_id}", f"api_get_user({user_id}, {platform})")
+    if user is not None:
+        _cache_user(user_id, platform, user)
+    return user
+
 def api_create_user(user_id: int, role: str = "student", username: str = "", platform: str = PLATFORM) -> Optional[Dict[str, Any]]:
     # Данные для создания пользователя с указанием платформы[cite: 9]
     payload = {"user_id": user_id, "role": role, "username": username, "platform": platform}
     try:
         r = _post(f"{API_URL}/users/", json=payload)
         if r.status_code == 200:
-            return r.json()
+            user = r.json()
+            _cache_user(user_id, platform, user)
+            return user
         print(f"[WARN] POST /users/ → {r.status_code}: {r.text[:200]}")
     except Exception as e:
         log_error(f"api_create_user({user_id}, {platform})", e)
@@ -46,84 +282,290 @@ def api_update_user(user_id: int, data: Dict[str, Any], platform: str = PLATFORM
         # Обновление данных пользователя через платформу[cite: 9]
         r = _put(f"{API_URL}/users/{platform}/{user_id}", json=data)
         if r.status_code == 200:
-            return r.json()
+            user = r.json()
+            _cache_user(user_id, platform, user)
+            return user
         print(f"[WARN] PUT /users/{platform}/{user_id} → {r.status_code}: {r.text[:200]}")
     except Exception as e:
         log_error(f"api_update_user({user_id}, {platform})", e)
+    # Состояние на сервере неизвестно — следующий запрос пойдёт в API
+    invalidate_user_cache(user_id, platform)
     return None
 
+def _fetch_users_page(skip: int, limit: int, platform: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    return _get_json(
+        f"{API_URL}/users/platform/{platform}",
+        f"_fetch_users_page(skip={skip}, limit={limit}, platform={platform})",
+        params={**params, "skip": skip, "limit": limit},
+    )
+
+def iter_users(page_size: int = USERS_PAGE_SIZE, prefetch: bool = True, platform: str = PLATFORM,
+               strict: bool = False, **params: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Постраничный обход всех пользователей платформы без ограничения в 1000.
+    В памяти держится не больше двух страниц; при prefetch следующая страница
+    запрашивается в фоне, пока вызывающий обрабатывает текущую.
+    strict=True — при ошибке API выбрасывается ApiUnavailable вместо тихого обрыва списка.
+    """
+    return _iter_users_from(0, platform, params, page_size, prefetch, strict)
+
+def _iter_users_from(skip: int, platform: str, params: Dict[str, Any],
+                     page_size: int = USERS_PAGE_SIZE, prefetch: bool = True,
+                     strict: bool = False) -> Iterator[Dict[str, Any]]:
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="users-prefetch") if prefetch else None
+    try:
+        page = _fetch_users_page(skip, page_size, platform, params)
+        while True:
+            if page is None:
+                if strict:
+                    raise ApiUnavailable(f"/users/platform/{platform}?skip={skip}")
+                return
+            if not page:
+                return
+            next_page = None
+            if len(page) >= page_size and pool is not None:
+                next_page = pool.submit(_fetch_users_page, skip + page_size, page_size, platform, params)
+            yield from page
+            if len(page) < page_size:
+                return
+            skip += page_size
+            page = next_page.result() if next_page is not None else _fetch_users_page(skip, page_size, platform, params)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False)
+
 def api_get_users(platform: str = PLATFORM) -> List[Dict[str, Any]]:
+    # Получение списка пользователей по платформе[cite: 9]
+    users: List[Dict[str, Any]] = []
     try:
-        params = {"skip": 0, "limit": 1000}
-        # Получение списка пользователей по платформе[cite: 9]
-        r = _get(f"{API_URL}/users/platform/{platform}", params=params)
-        if r.status_code == 200:
-            return r.json()
-        print(f"[WARN] GET /users/platform/{platform} → {r.status_code}: {r.text[:200]}")
-    except Exception as e:
-        log_error(f"api_get_users({platform})", e)
-    return []
+        for u in iter_users(platform=platform, strict=True):
+            users.append(u)
+    except ApiUnavailable as e:
+        # Неполный список не должен заменять индекс и счётчики — отдаём, что успели, как есть
+        print(f"[WARN] Список пользователей получен не полностью ({len(users)}), API недоступно: {e}")
+        return users
+    if platform == PLATFORM and users:
+        _user_index.replace(users)
+        user_stats.reconcile(users)
+    return users
 
-def api_get_users_page(skip: int = 0, limit: int = 10, platform: str = PLATFORM) -> List[Dict[str, Any]]:
+def refresh_user_stats() -> UserStats:
+    """Сверка счётчиков статистики с бэкендом потоковым проходом по всем пользователям."""
     try:
-        # Пагинация пользователей для конкретной платформы[cite: 9]
-        r = _get(f"{API_URL}/users/platform/{platform}", params={"skip": skip, "limit": limit})
-        if r.status_code == 200:
-            return r.json()
-        print(f"[WARN] GET /users/platform/{platform}?skip={skip}&limit={limit} → {r.status_code}: {r.text[:200]}")
-    except Exception as e:
-        log_error(f"api_get_users_page(skip={skip}, limit={limit}, platform={platform})", e)
+        # reconcile() проходит генератор до того, как тронуть счётчики: в памяти только
+        # ключи статистики, а на сбое страницы прежние счётчики остаются как были
+        user_stats.reconcile(iter_users(strict=True))
+    except ApiUnavailable as e:
+        print(f"[WARN] Статистика не сверена, API недоступно: {e}")
+    return user_stats
+
+def refresh_subscriber_index(platform: str = PLATFORM) -> bool:
+    """Полная перезагрузка индекса подписчиков; при ошибке API старый индекс остаётся как есть."""
+    try:
+        users = [
+            u for u in iter_users(platform=platform, strict=True, schedule_enabled="true")
+            if u.get("schedule_enabled")
+        ]
+    except ApiUnavailable as e:
+        print(f"[WARN] Индекс подписчиков не обновлён, API недоступно: {e}")
+        return False
+    subscriber_index.replace(users)
+    return True
+
+def _get_users_filtered(platform: str = PLATFORM, **filters: Any) -> List[Dict[str, Any]]:
+    """
+    Выборка пользователей с фильтрами на стороне сервера (group_name, role, schedule_enabled).
+    Если сервер фильтры проигнорировал (вернул лишние строки), дальше работаем по локальному индексу.
+    """
+    global _server_filters_supported
+    if _server_filters_supported is False and platform == PLATFORM:
+        if not _user_index.loaded_at or _user_index.age() > USER_INDEX_TTL:
+            api_get_users(platform)
+        return _user_index.query(**filters)
+
+    params = {key: str(value).lower() if isinstance(value, bool) else value for key, value in filters.items()}
+    rows = _fetch_users_page(0, USERS_PAGE_SIZE, platform, params)
+    if rows is not None:
+        matched = [u for u in rows if user_matches(u, filters)]
+        if len(matched) < len(rows):
+            # Бэкенд фильтры игнорирует — запоминаем это и дальше работаем по индексу
+            _server_filters_supported = False
+            if platform != PLATFORM:
+                return [u for u in iter_users(platform=platform) if user_matches(u, filters)]
+            if len(rows) < USERS_PAGE_SIZE:
+                _user_index.replace(rows)
+            else:
+                api_get_users(platform)
+            return _user_index.query(**filters)
+        if rows:
+            _server_filters_supported = True
+        if len(rows) < USERS_PAGE_SIZE:
+            return matched
+        # Отфильтрованная выборка больше страницы — дочитываем остальные страницы
+        return matched + [u for u in _iter_users_from(USERS_PAGE_SIZE, platform, params) if user_matches(u, filters)]
+    # API недоступно — отвечаем из индекса, если он есть
+    if platform == PLATFORM and _user_index.loaded_at:
+        return _user_index.query(**filters)
     return []
 
+def api_get_users_by_group(group_name: str, platform: str = PLATFORM) -> List[Dict[str, Any]]:
+    return _get_users_filtered(platform, group_name=group_name)
+
+def api_get_users_by_role(role: str, platform: str = PLATFORM) -> List[Dict[str, Any]]:
+    return _get_users_filtered(platform, role=role)
+
+def api_get_subscribed_users(platform: str = PLATFORM) -> List[Dict[str, Any]]:
+    return _get_users_filtered(platform, schedule_enabled=True)
+
+def api_get_users_page(skip: int = 0, limit: int = 10, platform: str = PLATFORM) -> List[Dict[str, Any]]:
+    # Пагинация пользователей для конкретной платформы[cite: 9]
+    rows = _get_json(
+        f"{API_URL}/users/platform/{platform}",
+        f"api_get_users_page(skip={skip}, limit={limit}, platform={platform})",
+        params={"skip": skip, "limit": limit},
+    )
+    return rows if rows is not None else []
+
 def api_get_users_page_peek(skip: int = 0, limit: int = 10, platform: str = PLATFORM) -> Tuple[List[Dict[str, Any]], bool]:
     rows = api_get_users_page(skip=skip, limit=limit + 1, platform=platform)
     has_next = len(rows) > limit
     return rows[:limit], has_next
 
-def api_get_all_groups() -> List[str]:
+_GROUP_COURSE_RE = re.compile(r"(\d+)")
+_GROUP_SUFFIX_RE = re.compile(r"\d+\s*([А-Яа-яA-Za-z]*)")
+
+def _group_sort_key(g: str):
+    m = _GROUP_COURSE_RE.match(g)
+    course = int(m.group(1)) if m else 0
+    m2 = _GROUP_SUFFIX_RE.match(g)
+    suf = m2.group(1) if m2 else g
+    return (course, suf)
+
+class GroupCatalogue:
+    """Отсортированный список групп и множество для проверки «это название группы?» за O(1)."""
+
+    def __init__(self, groups: Iterable[str], revision: int = 0):
+        self.groups: Tuple[str, ...] = tuple(sorted(dict.fromkeys(groups), key=_group_sort_key))
+        self.group_set = frozenset(self.groups)
+        self.revision = revision
+        self.loaded_at = time.monotonic()
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.group_set
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+_group_catalogue: Optional[GroupCatalogue] = None
+_group_catalogue_revision = 0
+_group_catalogue_lock = Lock()
+# Последний удачно загруженный каталог — отдаётся, пока API недоступно (в том числе после сброса)
+_last_group_catalogue: Optional[GroupCatalogue] = None
+_group_catalogue_refreshing = False
+
+def invalidate_group_catalogue():
+    global _group_catalogue
+    with _group_catalogue_lock:
+        _group_catalogue = None
+
+def _parse_group_names(arr: Any) -> List[str]:
+    groups: List[str] = []
+    for item in arr:
+        if isinstance(item, dict) and "group_name" in item:
+            groups.append(item["group_name"])
+        elif isinstance(item, str):
+            groups.append(item)
+    return groups
+
+def _fetch_group_names() -> Optional[List[str]]:
+    arr = _get_json(f"{API_URL}/schedule/", "api_get_all_groups()", conditional=True)
+    return _parse_group_names(arr) if arr is not None else None
+
+def _fresh_group_catalogue() -> Optional[GroupCatalogue]:
+    catalogue = _group_catalogue
+    if catalogue is not None and time.monotonic() - catalogue.loaded_at < GROUPS_CACHE_TTL:
+        return catalogue
+    return None
+
+def _store_group_catalogue(names: Optional[List[str]]) -> GroupCatalogue:
+    """Вызывается под _group_catalogue_lock."""
+    global _group_catalogue, _group_catalogue_revision, _last_group_catalogue
+    if names is None:
+        # Ошибка API: результат не кэшируем, следующий вызов попробует снова;
+        # пока — последний известный каталог, если он был
+        if _last_group_catalogue is not None:
+            return _last_group_catalogue
+        return GroupCatalogue([], revision=_group_catalogue_revision)
+    catalogue = _group_catalogue
+    if catalogue is None or set(names) != catalogue.group_set:
+        _group_catalogue_revision += 1
+    _group_catalogue = _last_group_catalogue = GroupCatalogue(names, revision=_group_catalogue_revision)
+    return _group_catalogue
+
+def _refresh_group_catalogue():
+    global _group_catalogue_refreshing
     try:
-        r = _get(f"{API_URL}/schedule/")
-        if r.status_code != 200:
-            return []
-        arr = r.json()
-        groups: List[str] = []
-        for item in arr:
-            if isinstance(item, dict) and "group_name" in item:
-                groups.append(item["group_name"])
-            elif isinstance(item, str):
-                groups.append(item)
-
-        import re
-        def key_fn(g: str):
-            m = re.match(r"(\d+)", g)
-            course = int(m.group(1)) if m else 0
-            m2 = re.match(r"\d+\s*([А-Яа-яA-Za-z]*)", g)
-            suf = m2.group(1) if m2 else g
-            return (course, suf)
-        return sorted(list(dict.fromkeys(groups)), key=key_fn)
+        names = _fetch_group_names()
+        with _group_catalogue_lock:
+            # Неудачное обновление не затирает устаревший, но рабочий каталог
+            if names is not None:
+                _store_group_catalogue(names)
     except Exception as e:
-        log_error("api_get_all_groups()", e)
-        return []
+        log_error("_refresh_group_catalogue()", e)
+    finally:
+        _group_catalogue_refreshing = False
+
+def api_get_group_catalogue() -> GroupCatalogue:
+    global _group_catalogue_refreshing
+    catalogue = _fresh_group_catalogue()
+    if catalogue is not None:
+        return catalogue
+    catalogue = _group_catalogue
+    if catalogue is not None:
+        # Каталог устарел: отдаём его сразу, свежий подтягивается в фоне
+        with _revalidate_lock:
+            start = not _group_catalogue_refreshing
+            _group_catalogue_refreshing = True
+        if start:
+            _revalidate_pool.submit(_refresh_group_catalogue)
+        return catalogue
+    with _group_catalogue_lock:
+        # Пока ждали лок, каталог мог обновить другой поток
+        catalogue = _fresh_group_catalogue()
+        if catalogue is not None:
+            return catalogue
+        return _store_group_catalogue(_fetch_group_names())
+
+def api_get_all_groups() -> List[str]:
+    return list(api_get_group_catalogue().groups)
 
 def api_get_schedule(group_name: str) -> Optional[Dict[str, Any]]:
+    return _cached_schedule_get(
+        ("group", group_name),
+        f"{API_URL}/schedule/{group_name}",
+        f"api_get_schedule({group_name})",
+    )
+
+def api_get_current_schedule(group_name: str) -> Optional[Dict[str, Any]]:
+    """Как api_get_schedule, но без устаревшей копии: None, если актуальный документ получить не удалось."""
+    key = ("group", group_name)
+    cached = _schedule_cache.get(key)
+    if cached is not None:
+        return cached
     try:
-        r = _get(f"{API_URL}/schedule/{group_name}")
-        if r.status_code == 200:
-            return r.json()
-        print(f"[WARN] GET /schedule/{group_name} → {r.status_code}: {r.text[:200]}")
-    except Exception as e:
-        log_error(f"api_get_schedule({group_name})", e)
-    return None
+        return _fetch_schedule(key, f"{API_URL}/schedule/{group_name}", f"api_get_current_schedule({group_name})", _schedule_version)
+    except ApiUnavailable:
+        return None
 
 def api_get_teacher_schedule(fio_key: str) -> Optional[Dict[str, Any]]:
-    try:
-        r = _get(f"{API_URL}/schedule/teacher/{fio_key}")
-        if r.status_code == 200:
-            return r.json()
-        print(f"[WARN] GET /schedule/teacher/{fio_key} → {r.status_code}: {r.text[:200]}")
-    except Exception as e:
-        log_error(f"api_get_teacher_schedule({fio_key})", e)
-    return None
+    return _cached_schedule_get(
+        ("teacher", fio_key),
+        f"{API_URL}/schedule/teacher/{fio_key}",
+        f"api_get_teacher_schedule({fio_key})",
+    )
 
 def api_upload_schedule(docx_bytes: bytes, json_bytes: bytes | None = None):
     files = {
@@ -134,6 +576,7 @@ def api_upload_schedule(docx_bytes: bytes, json_bytes: bytes | None = None):
     try:
         resp = _post(f"{API_URL}/schedule/upload", files=files)
         if resp.status_code == 200:
+            invalidate_schedule_cache()
             return resp.json()
         print("Ошибка:", resp.text)
     except Exception as e:
@@ -160,6 +603,8 @@ def api_upload_bell_schedule(json_bytes: bytes):
     try:
         resp = _post(f"{API_URL}/bell_schedule/upload", files=files)
         if resp.status_code == 200:
+            # Время пар входит в документы расписаний — сбрасываем их тоже
+            invalidate_schedule_cache()
             return resp.json()
         print("Ошибка при загрузке звонков:", resp.text)
     except Exception as e:
@@ -168,12 +613,9 @@ def api_upload_bell_schedule(json_bytes: bytes):
 
 def api_get_users_to_notify(time_str: str, platform: str = PLATFORM) -> List[Dict[str, Any]]:
     """Получает список пользователей, которым нужно отправить расписание в указанное время."""
-    try:
-        # Эндпоинт согласно схеме: /users/schedule/send/{platform}/{time}
-        r = _get(f"{API_URL}/users/schedule/send/{platform}/{time_str}")
-        if r.status_code == 200:
-            return r.json()
-        print(f"[WARN] GET /users/notify/{platform}/{time_str} → {r.status_code}")
-    except Exception as e:
-        log_error(f"api_get_users_to_notify({time_str}, {platform})", e)
-    return []
\ No newline at end of file
+    # Эндпоинт согласно схеме: /users/schedule/send/{platform}/{time}
+    users = _get_json(
+        f"{API_URL}/users/schedule/send/{platform}/{time_str}",
+        f"api_get_users_to_notify({time_str}, {platform})",
+    )
+    return users if users is not None else []
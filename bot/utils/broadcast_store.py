@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from config import BROADCAST_DB_PATH
+
+# Статусы доставки одному получателю:
+#   pending — ещё не отправляли
+#   sending — запрос в Telegram ушёл, ответа ещё нет
+#   sent / failed — итог известен
+#   unknown — процесс упал во время отправки; повторно НЕ отправляем, чтобы не было дублей
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_id INTEGER NOT NULL,
+    context_name TEXT NOT NULL,
+    method TEXT NOT NULL,
+    args TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    job_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    updated_at REAL,
+    payload TEXT,
+    PRIMARY KEY (job_id, user_id)
+);
+"""
+
+# Получатель рассылки: id (сообщение общее для всех — args/kwargs задания)
+# или (id, args, kwargs) — своё сообщение, например с расписанием его группы
+Recipient = Union[int, Tuple[int, list, Dict[str, Any]]]
+
+class BroadcastStore:
+    """Рассылки и состояние доставки каждому получателю в SQLite — переживают перезапуск контейнера."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(broadcast_deliveries)")}
+            if "payload" not in columns:
+                # База создана до появления персональных сообщений
+                self._conn.execute("ALTER TABLE broadcast_deliveries ADD COLUMN payload TEXT")
+
+    def create_job(self, admin_id: int, context_name: str, method: str, args: list, kwargs: Dict[str, Any],
+                   user_ids: Iterable[Recipient]) -> int:
+        # user_ids может быть генератором, читающим страницы из API: выбираем его до лока и транзакции,
+        # чтобы медленный бэкенд не держал claim/mark остальных рассылок
+        rows = []
+        for item in user_ids:
+            if isinstance(item, tuple):
+                uid, own_args, own_kwargs = item
+                rows.append((int(uid), json.dumps({"args": list(own_args), "kwargs": own_kwargs})))
+            else:
+                rows.append((int(item), None))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                cur = self._conn.execute(
+                    "INSERT INTO broadcast_jobs (admin_id, context_name, method, args, kwargs, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (admin_id, context_name, method, json.dumps(list(args)), json.dumps(kwargs), time.time()),
+                )
+                job_id = cur.lastrowid
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO broadcast_deliveries (job_id, user_id, payload) VALUES (?, ?, ?)",
+                    ((job_id, uid, payload) for uid, payload in rows),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["args"] = json.loads(job["args"])
+        job["kwargs"] = json.loads(job["kwargs"])
+        return job
+
+    def active_jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM broadcast_jobs WHERE status = 'running' ORDER BY id").fetchall()
+        return [self.get_job(r["id"]) for r in rows]
+
+    def pending_deliveries(self, job_id: int) -> List[Tuple[int, Optional[Dict[str, Any]]]]:
+        """(user_id, персональные {args, kwargs} или None) для получателей в статусе pending."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, payload FROM broadcast_deliveries WHERE job_id = ? AND status = 'pending'", (job_id,)
+            ).fetchall()
+        return [(r["user_id"], json.loads(r["payload"]) if r["payload"] else None) for r in rows]
+
+    def claim(self, job_id: int, user_id: int) -> bool:
+        """Атомарно переводит pending → sending. False — получателю уже отправляли."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE broadcast_deliveries SET status = 'sending', updated_at = ? "
+                "WHERE job_id = ? AND user_id = ? AND status = 'pending'",
+                (time.time(), job_id, user_id),
+            )
+        return cur.rowcount == 1
+
+    def mark(self, job_id: int, user_id: int, status: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE broadcast_deliveries SET status = ?, updated_at = ? WHERE job_id = ? AND user_id = ?",
+                (status, time.time(), job_id, user_id),
+            )
+
+    def counts(self, job_id: int) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM broadcast_deliveries WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def finish(self, job_id: int, status: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE broadcast_jobs SET status = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                (status, time.time(), job_id),
+            )
+
+    def recover_interrupted(self) -> int:
+        """После рестарта отправки в состоянии sending считаются неизвестными и не повторяются."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE broadcast_deliveries SET status = 'unknown', updated_at = ? WHERE status = 'sending'",
+                (time.time(),),
+            )
+        return cur.rowcount
+
+_store: Optional[BroadcastStore] = None
+_store_lock = Lock()
+
+def get_broadcast_store() -> BroadcastStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BroadcastStore(BROADCAST_DB_PATH)
+    return _store
@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Потокобезопасный in-memory кэш с временем жизни записей.
+    Хэндлеры TeleBot работают в нескольких потоках, поэтому все операции под локом.
+    Если задан maxsize — при переполнении вытесняется давно не использованная запись (LRU).
+    """
+
+    def __init__(self, ttl: float, maxsize: Optional[int] = None, name: str = "cache"):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
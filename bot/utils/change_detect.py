@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, FrozenSet, List, Optional, Set
+from config import WARMUP_WORKERS
+from .api import api_get_current_schedule, api_get_group_catalogue, api_get_schedule
+from .render_cache import schedule_digest
+from .teacher_index import teachers_in
+
+# Какие группы реально изменились после загрузки: хэши расписаний всех групп
+# снимаются до api_upload_schedule и сравниваются с хэшами после неё.
+# Уведомления получают только студенты этих групп и преподаватели, чьи пары в них были или стали.
+
+class ScheduleSnapshot:
+    def __init__(self):
+        self.hashes: Dict[str, str] = {}
+        self.teachers: Dict[str, FrozenSet[str]] = {}  # группа → ключи преподавателей (teacher_key)
+
+class ScheduleChanges:
+    def __init__(self, groups: List[str], teacher_keys: Set[str], unknown: List[str]):
+        self.groups = groups
+        self.teacher_keys = teacher_keys
+        self.unknown = unknown  # после загрузки расписание не получено — изменения неизвестны
+
+def _lesson_teachers(doc: dict) -> FrozenSet[str]:
+    schedule = doc.get("schedule") or {}
+    keys = set()
+    for info in (schedule.get("zero_lesson") or {}).values():
+        keys.update(teachers_in((info or {}).get("teacher", "")))
+    for lessons in (schedule.get("days") or {}).values():
+        for info in (lessons or {}).values():
+            keys.update(teachers_in(info.get("teacher", "")))
+    return frozenset(keys)
+
+def take_schedule_snapshot(groups: Optional[List[str]] = None, current_only: bool = False) -> ScheduleSnapshot:
+    """current_only=True — без устаревших копий: группа, которую не удалось получить, в снимок не попадает."""
+    snapshot = ScheduleSnapshot()
+    names = list(groups if groups is not None else api_get_group_catalogue().groups)
+    fetch = api_get_current_schedule if current_only else api_get_schedule
+    with ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="schedule-snapshot") as pool:
+        docs = dict(zip(names, pool.map(fetch, names)))
+    for group, doc in docs.items():
+        if doc is None:
+            continue
+        snapshot.hashes[group] = schedule_digest(doc)
+        snapshot.teachers[group] = _lesson_teachers(doc)
+    return snapshot
+
+def detect_changes(before: ScheduleSnapshot) -> ScheduleChanges:
+    """Сравнивает снимок до загрузки с текущим состоянием API (кэш уже сброшен загрузкой)."""
+    catalogue = api_get_group_catalogue()
+    # Старая копия при недоступном API совпала бы со снимком «до» — такие группы должны стать unknown
+    after = take_schedule_snapshot(list(catalogue.groups), current_only=True)
+    changed = [g for g, digest in after.hashes.items() if before.hashes.get(g) != digest]
+    unknown = [g for g in catalogue.groups if g not in after.hashes]
+    teacher_keys: Set[str] = set()
+    for group in changed:
+        teacher_keys |= before.teachers.get(group, frozenset()) | after.teachers[group]
+    return ScheduleChanges(changed, teacher_keys, unknown)
@@ -0,0 +1,66 @@
+import time
+from threading import Lock
+from typing import Any, Dict
+
+class CircuitBreaker:
+    """
+    Размыкатель для общего HTTP-клиента: после failure_threshold сбоев подряд запросы
+    не отправляются reset_timeout секунд и сразу получают отказ. Затем пропускается
+    один пробный запрос: успех замыкает цепь, сбой снова размыкает её.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, name: str = "api"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._lock = Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"✅ {self.name}: цепь снова замкнута, отклонено запросов за время сбоя: {self.rejected}")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.rejected = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                    print(f"[WARN] {self.name}: {self.failures} сбоев подряд, запросы не отправляются {self.reset_timeout:.0f} с")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "trips": self.trips,
+            }
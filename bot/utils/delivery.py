@@ -0,0 +1,179 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from telebot.apihelper import ApiTelegramException
+from config import DELIVERY_WORKERS, TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_INTERVAL
+from .logger import log_error
+
+# (chat_id, метод бота, args, kwargs)
+DeliveryJob = Tuple[int, Callable[..., Any], tuple, Dict[str, Any]]
+
+class TokenBucket:
+    """Глобальный лимит Telegram (~30 сообщений в секунду на бота)."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """После 429 Telegram просит подождать — притормаживаем все отправки, а не один поток."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            # Пополнение начинается с конца паузы, иначе после неё ведро сразу окажется полным
+            self._updated = self._paused_until
+
+class ChatRateLimiter:
+    """Не чаще одного сообщения в секунду в один чат."""
+
+    def __init__(self, interval: float):
+        self.interval = float(interval)
+        self._next_at: Dict[int, float] = {}
+        self._lock = Lock()
+
+    def acquire(self, chat_id: int):
+        with self._lock:
+            now = time.monotonic()
+            if len(self._next_at) > 10000:
+                self._next_at = {k: v for k, v in self._next_at.items() if v > now}
+            at = max(now, self._next_at.get(chat_id, 0.0))
+            self._next_at[chat_id] = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """Возвращает retry_after из ответа 429, иначе None."""
+    if isinstance(e, ApiTelegramException) and e.error_code == 429:
+        params = (e.result_json or {}).get("parameters") or {}
+        return float(params.get("retry_after", 1))
+    return None
+
+class DeliveryCancelled(Exception):
+    pass
+
+class DeliveryRun:
+    """Счётчики одной пачки отправок."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.done = Event()
+        self.cancelled = Event()
+        self._lock = Lock()
+
+    def cancel(self):
+        """Оставшиеся в очереди отправки завершатся без обращения к Telegram."""
+        self.cancelled.set()
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rate(self) -> float:
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+class DeliveryEngine:
+    """
+    Отправка сообщений пулом потоков с учётом лимитов Telegram.
+    deliver() не блокирует вызывающего: задание планировщика ставит пачку в очередь и сразу завершается.
+    """
+
+    def __init__(self, workers: int = DELIVERY_WORKERS, bucket: Optional[TokenBucket] = None,
+                 chat_limiter: Optional[ChatRateLimiter] = None, max_retries: int = 3):
+        self.bucket = bucket or TokenBucket(TELEGRAM_GLOBAL_RATE)
+        self.chat_limiter = chat_limiter or ChatRateLimiter(TELEGRAM_PER_CHAT_INTERVAL)
+        self.max_retries = max_retries
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="delivery")
+
+    def send(self, chat_id: int, method: Callable[..., Any], *args, run: Optional[DeliveryRun] = None, **kwargs) -> Any:
+        """Синхронная отправка с лимитами и повтором после 429. Пробрасывает последнюю ошибку."""
+        attempt = 0
+        while True:
+            if run is not None and run.cancelled.is_set():
+                raise DeliveryCancelled()
+            self.chat_limiter.acquire(chat_id)
+            self.bucket.acquire()
+            try:
+                return method(chat_id, *args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                wait = retry_after_seconds(e)
+                if wait is None or attempt > self.max_retries:
+                    raise
+                self.bucket.pause(wait)
+                if run is not None:
+                    with run._lock:
+                        run.retries += 1
+
+    def submit(self, chat_id: int, method: Callable[..., Any], *args, **kwargs) -> Future:
+        return self._pool.submit(self.send, chat_id, method, *args, **kwargs)
+
+    def deliver(self, jobs: Iterable[DeliveryJob], on_done: Optional[Callable[[DeliveryRun], None]] = None,
+                on_error: Optional[Callable[[int, BaseException], None]] = None) -> DeliveryRun:
+        jobs = list(jobs)
+        run = DeliveryRun(len(jobs))
+
+        def _finish(chat_id: int, future: Future):
+            error = future.exception()
+            if error is not None and on_error:
+                on_error(chat_id, error)
+            with run._lock:
+                if error is None:
+                    run.sent += 1
+                else:
+                    run.failed += 1
+                finished = run.processed == run.total
+                if finished:
+                    run.finished_at = time.monotonic()
+            if finished:
+                run.done.set()
+                if on_done:
+                    try:
+                        on_done(run)
+                    except Exception as e:
+                        log_error("DeliveryEngine.on_done", e)
+
+        if not jobs:
+            run.finished_at = time.monotonic()
+            run.done.set()
+            if on_done:
+                on_done(run)
+            return run
+
+        for chat_id, method, args, kwargs in jobs:
+            future = self._pool.submit(self.send, chat_id, method, *args, run=run, **kwargs)
+            future.add_done_callback(partial(_finish, chat_id))
+        return run
+
+# Лимиты Telegram общие для всего бота, поэтому и движок один на процесс
+delivery_engine = DeliveryEngine()
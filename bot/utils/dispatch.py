@@ -0,0 +1,134 @@
+import time
+from collections import deque
+from threading import Condition, Event, Thread
+from typing import Any, Deque, Dict, Hashable, Optional
+from .logger import log_error
+
+def _chat_key(args: tuple) -> Hashable:
+    """Ключ очереди: id пользователя (для сообщений и callback одинаковый в личном чате)."""
+    obj = args[0] if args else None
+    from_user = getattr(obj, "from_user", None)
+    if from_user is not None:
+        return from_user.id
+    chat = getattr(obj, "chat", None)
+    if chat is not None:
+        return chat.id
+    # Апдейт без пользователя — выполняем без упорядочивания
+    return object()
+
+class ChatOrderedPool:
+    """
+    Замена telebot.util.ThreadPool для TeleBot(threaded=True).
+    - ограниченное число рабочих потоков;
+    - задачи одного чата выполняются строго по очереди (next_step-сценарии не перемешиваются),
+      разные чаты — параллельно;
+    - при переполнении очереди put() блокирует поток polling — это и есть backpressure:
+      новые апдейты не запрашиваются, пока обработчики не разгребут очередь.
+    """
+
+    def __init__(self, telebot, num_threads: int, max_pending: int, warn_pending: Optional[int] = None):
+        self.telebot = telebot
+        self.num_threads = num_threads
+        self.max_pending = max_pending
+        self.warn_pending = warn_pending or max(1, max_pending // 2)
+
+        self._cond = Condition()
+        self._queues: Dict[Hashable, Deque[tuple]] = {}
+        self._ready: Deque[Hashable] = deque()
+        self._busy: set = set()
+        self._pending = 0
+        self._stopped = False
+
+        self.active = 0
+        self.processed = 0
+        self.max_pending_seen = 0
+        self.blocked_puts = 0
+        self._last_warn = 0.0
+
+        # Интерфейс telebot.util.ThreadPool
+        self.exception_event = Event()
+        self.exception_info = None
+
+        self.workers = [Thread(target=self._worker, name=f"handler-{i}", daemon=True) for i in range(num_threads)]
+        for w in self.workers:
+            w.start()
+
+    def put(self, func, *args, **kwargs):
+        key = _chat_key(args)
+        with self._cond:
+            if self._pending >= self.max_pending:
+                self.blocked_puts += 1
+                self._cond.wait_for(lambda: self._pending < self.max_pending or self._stopped)
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+                if key not in self._busy:
+                    self._ready.append(key)
+            queue.append((func, args, kwargs))
+            self._pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self._pending)
+            pending = self._pending
+            self._cond.notify_all()
+        if pending >= self.warn_pending and time.monotonic() - self._last_warn > 30:
+            self._last_warn = time.monotonic()
+            print(f"[WARN] Очередь обработчиков: {pending} задач (лимит {self.max_pending}), {self.stats()}")
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ready or self._stopped)
+                if self._stopped and not self._ready:
+                    return
+                key = self._ready.popleft()
+                queue = self._queues[key]
+                func, args, kwargs = queue.popleft()
+                if not queue:
+                    del self._queues[key]
+                self._busy.add(key)
+                self.active += 1
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self.on_exception(e)
+            finally:
+                with self._cond:
+                    self._busy.discard(key)
+                    self.active -= 1
+                    self._pending -= 1
+                    self.processed += 1
+                    # Следующая задача этого чата становится доступной только после завершения текущей
+                    if key in self._queues:
+                        self._ready.append(key)
+                    self._cond.notify_all()
+
+    def on_exception(self, e: Exception):
+        handled = False
+        if self.telebot.exception_handler is not None:
+            handled = self.telebot.exception_handler.handle(e)
+        if not handled:
+            log_error("handler", e)
+
+    def raise_exceptions(self):
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self):
+        self.exception_event.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": self._pending,
+                "active": self.active,
+                "chats_waiting": len(self._queues),
+                "processed": self.processed,
+                "max_pending_seen": self.max_pending_seen,
+                "blocked_puts": self.blocked_puts,
+            }
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for w in self.workers:
+            w.join(timeout=5)
@@ -0,0 +1,254 @@
+import io
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from config import DAYS_RU, WARMUP_WORKERS
+from .api import api_get_group_catalogue, api_get_schedule
+from .teacher_index import TEACHER_RE, teachers_in
+
+# Локальный разбор «Расписание.docx» до отправки на сервер: какие группы и пары в файле,
+# чем он отличается от текущего расписания. Разбор потоковый (iterparse): в памяти
+# держится только текущая таблица, обработанные элементы сразу удаляются из дерева.
+#
+# Формат файла: перед каждой таблицей абзац «Расписание уроков для 1ИС-1 группы с …»;
+# в таблице первая строка — дни недели (день может занимать две колонки — подгруппы),
+# первая колонка — номер пары; пара из двух строк (vMerge) — половинки [1/2] и [2/2].
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_GROUP_TITLE_RE = re.compile(r"для\s+(.+?)\s+группы", re.IGNORECASE)
+_CLASSROOM_RE = re.compile(r"(\d{1,4}[а-яА-Яa-zA-Z]?)\s*(?:каб\.?)?\s*$")
+
+class _Cell:
+    __slots__ = ("paragraphs", "span", "vmerge")
+
+    def __init__(self, elem: ET.Element):
+        self.paragraphs = [_paragraph_text(p) for p in elem.iter(_W + "p")]
+        pr = elem.find(_W + "tcPr")
+        span = pr.find(_W + "gridSpan") if pr is not None else None
+        vmerge = pr.find(_W + "vMerge") if pr is not None else None
+        self.span = int(span.get(_W + "val", 1)) if span is not None else 1
+        # restart — начало объединения по вертикали, continue — продолжение
+        self.vmerge = (vmerge.get(_W + "val") or "continue") if vmerge is not None else None
+
+    @property
+    def text(self) -> str:
+        return re.sub(r"\s+", " ", " ".join(self.paragraphs)).strip()
+
+def _paragraph_text(p: ET.Element) -> str:
+    parts = []
+    for node in p.iter():
+        if node.tag == _W + "t":
+            parts.append(node.text or "")
+        elif node.tag in (_W + "tab", _W + "br"):
+            parts.append(" ")
+    return "".join(parts)
+
+def _iter_blocks(docx_bytes: bytes) -> Iterator[Tuple[str, Any]]:
+    """Верхнеуровневые блоки документа: ('p', текст) и ('tbl', строки из _Cell)."""
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as zf, zf.open("word/document.xml") as xml:
+        body = None
+        tbl_depth = 0
+        rows: List[List[_Cell]] = []
+        row: List[_Cell] = []
+        for event, elem in ET.iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _W + "body":
+                    body = elem
+                elif tag == _W + "tbl":
+                    tbl_depth += 1
+                continue
+            if tag == _W + "tc" and tbl_depth == 1:
+                row.append(_Cell(elem))
+                elem.clear()
+            elif tag == _W + "tr" and tbl_depth == 1:
+                rows.append(row)
+                row = []
+                elem.clear()
+            elif tag == _W + "tbl":
+                tbl_depth -= 1
+                if tbl_depth == 0:
+                    yield "tbl", rows
+                    rows = []
+            elif tag == _W + "p" and tbl_depth == 0:
+                yield "p", _paragraph_text(elem)
+            if body is not None and tbl_depth == 0 and tag in (_W + "p", _W + "tbl", _W + "sectPr"):
+                # блок обработан — выкидываем его из дерева, чтобы документ не копился в памяти
+                body.clear()
+
+def _parse_lesson(text: str) -> Optional[Dict[str, str]]:
+    if not text:
+        return None
+    matches = list(TEACHER_RE.finditer(text))
+    if not matches:
+        return {"subject": text, "teacher": "", "classroom": ""}
+    tail = text[matches[-1].end():]
+    room = _CLASSROOM_RE.search(tail)
+    return {
+        "subject": text[:matches[0].start()].strip(" ,;/"),
+        "teacher": ", ".join(_normalize_teacher(m) for m in matches),
+        "classroom": room.group(1) if room else "",
+    }
+
+def _normalize_teacher(m: re.Match) -> str:
+    fam, first, middle = m.groups()
+    return f"{fam} {first}.{middle + '.' if middle else ''}"
+
+def _parse_table(rows: List[List[_Cell]]) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    if not rows:
+        return None
+    # колонка сетки → (день, номер колонки внутри дня, сколько колонок у дня)
+    col_day: Dict[int, Tuple[str, int, int]] = {}
+    col = 0
+    for cell in rows[0]:
+        for i in range(cell.span):
+            col_day[col + i] = (cell.text, i, cell.span)
+        col += cell.span
+    if not any(day in DAYS_RU for day, _, _ in col_day.values()):
+        return None
+
+    days: Dict[str, List[Dict[str, Any]]] = {}
+    number: Optional[int] = None
+    for row in rows[1:]:
+        if not row:
+            continue
+        num_cell = row[0]
+        digits = re.match(r"\d+", num_cell.text)
+        if num_cell.vmerge == "continue" or (not digits and number is not None):
+            half = 2
+        else:
+            number = int(digits.group(0)) if digits else None
+            half = 1 if num_cell.vmerge == "restart" else None
+        if number is None:
+            continue
+        col = num_cell.span
+        for cell in row[1:]:
+            start, col = col, col + cell.span
+            if cell.vmerge == "continue":
+                continue
+            day, sub_index, day_span = col_day.get(start, ("", 0, 1))
+            lesson = _parse_lesson(cell.text)
+            if day not in DAYS_RU or lesson is None:
+                continue
+            days.setdefault(day, []).append({
+                "number": number,
+                # ячейка, объединённая на обе строки пары, — целая пара
+                "half": None if cell.vmerge == "restart" else half,
+                "subgroup": sub_index + 1 if cell.span < day_span else None,
+                **lesson,
+            })
+    return days
+
+def parse_schedule_docx(docx_bytes: bytes) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """Группа → день → список пар ({number, half, subgroup, subject, teacher, classroom})."""
+    groups: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    title: Optional[str] = None
+    for kind, block in _iter_blocks(docx_bytes):
+        if kind == "p":
+            m = _GROUP_TITLE_RE.search(re.sub(r"\s+", " ", block))
+            if m:
+                title = m.group(1).strip()
+            continue
+        if title is None:
+            continue
+        days = _parse_table(block)
+        if days is not None:
+            groups[title] = days
+            title = None
+    return groups
+
+# ---------- сравнение с текущим расписанием ----------
+
+Signature = Tuple[str, int, str, Tuple[str, ...]]
+
+def _signature(day: str, number: int, subject: str, teacher: str) -> Signature:
+    return (day, number, re.sub(r"\s+", " ", subject or "").strip().lower(), tuple(sorted(teachers_in(teacher))))
+
+def parsed_signatures(days: Dict[str, List[Dict[str, Any]]]) -> Counter:
+    return Counter(
+        _signature(day, lesson["number"], lesson["subject"], lesson["teacher"])
+        for day, lessons in days.items() for lesson in lessons
+    )
+
+def doc_signatures(doc: Dict[str, Any]) -> Counter:
+    """Те же сигнатуры для документа с сервера: номер пары без половинок/подгрупп, без кабинета и времени."""
+    schedule = (doc or {}).get("schedule") or {}
+    result: Counter = Counter()
+    for day, info in (schedule.get("zero_lesson") or {}).items():
+        if info and info.get("subject"):
+            result[_signature(day, 0, info.get("subject", ""), info.get("teacher", ""))] += 1
+    for day, lessons in (schedule.get("days") or {}).items():
+        for num, info in (lessons or {}).items():
+            if info.get("subject"):
+                base = int(str(num).split(".")[0]) if str(num).split(".")[0].isdigit() else 0
+                result[_signature(day, base, info.get("subject", ""), info.get("teacher", ""))] += 1
+    return result
+
+class ScheduleDiff:
+    def __init__(self):
+        self.total_groups = 0
+        self.unchanged: List[str] = []
+        self.added_groups: List[str] = []
+        self.removed_groups: List[str] = []
+        # группа → (добавленные сигнатуры, убранные сигнатуры)
+        self.changed: Dict[str, Tuple[List[Signature], List[Signature]]] = {}
+
+    @property
+    def affected_groups(self) -> List[str]:
+        """Группы, которым стоит сообщить об изменениях (удалённым из файла сообщать нечего)."""
+        return list(self.changed) + self.added_groups
+
+def diff_against_current(parsed: Dict[str, Dict[str, List[Dict[str, Any]]]]) -> ScheduleDiff:
+    diff = ScheduleDiff()
+    diff.total_groups = len(parsed)
+    catalogue = api_get_group_catalogue()
+    names = list(parsed)
+    with ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="schedule-diff") as pool:
+        current = dict(zip(names, pool.map(api_get_schedule, names)))
+    for group in names:
+        doc = current.get(group)
+        if doc is None:
+            diff.added_groups.append(group)
+            continue
+        new, old = parsed_signatures(parsed[group]), doc_signatures(doc)
+        if new == old:
+            diff.unchanged.append(group)
+        else:
+            diff.changed[group] = (sorted((new - old).elements()), sorted((old - new).elements()))
+    diff.removed_groups = [g for g in catalogue.groups if g not in parsed]
+    return diff
+
+def _short_day(day: str) -> str:
+    return day[:2]
+
+def _lesson_label(sig: Signature) -> str:
+    day, number, subject, _teachers = sig
+    return f"{_short_day(day)} {number}: {subject}"
+
+def format_diff_preview(diff: ScheduleDiff, max_groups: int = 15, max_lines: int = 4) -> str:
+    lines = [
+        "🔍 Предпросмотр расписания\n",
+        f"Групп в файле: {diff.total_groups}",
+        f"✏️ Изменилось: {len(diff.changed)}",
+        f"🆕 Новых: {len(diff.added_groups)}",
+        f"➖ Нет в файле: {len(diff.removed_groups)}",
+        f"✅ Без изменений: {len(diff.unchanged)}",
+    ]
+    if diff.changed:
+        lines.append("")
+        for group, (added, removed) in list(diff.changed.items())[:max_groups]:
+            lines.append(f"• {group}: +{len(added)} / −{len(removed)}")
+            details = [f"   − {_lesson_label(s)}" for s in removed] + [f"   + {_lesson_label(s)}" for s in added]
+            lines.extend(details[:max_lines])
+            if len(details) > max_lines:
+                lines.append(f"   … ещё {len(details) - max_lines}")
+        if len(diff.changed) > max_groups:
+            lines.append(f"… и ещё {len(diff.changed) - max_groups} групп")
+    if diff.added_groups:
+        lines.append("\n🆕 " + ", ".join(diff.added_groups[:30]))
+    if diff.removed_groups:
+        lines.append("➖ " + ", ".join(diff.removed_groups[:30]))
+    return "\n".join(lines)[:4000]
@@ -1,85 +1,218 @@
-import asyncio
-from threading import Thread
+from functools import partial
+from threading import Lock, Thread
 from bot.core import bot
 from bot.handlers.commands import is_admin
 from telebot import types
-from bot.utils.api import api_get_users
+from telebot.apihelper import ApiTelegramException
+from bot.utils.api import iter_users, api_get_schedule, api_get_users_by_group, api_get_users_by_role
+from bot.utils.broadcast_store import get_broadcast_store
+from bot.utils.delivery import DeliveryEngine, DeliveryRun, delivery_engine, retry_after_seconds
+from bot.utils.change_detect import ScheduleChanges, ScheduleSnapshot, detect_changes
+from bot.utils.fio_utils import fio_full_to_initials
+from bot.utils.logger import log_error
+from bot.utils.render_cache import render_schedule_for_day, render_teacher_schedule_for_day
+from bot.utils.schedule_utils import get_current_day, get_tomorrow_day
+from bot.utils.teacher_index import get_teacher_schedule, teacher_key
+from config import BROADCAST_WORKERS, NOTIFY_CHANGES_WITH_SCHEDULE
 
+# Свой пул потоков, чтобы большая рассылка не задерживала ежедневное расписание,
+# но лимиты Telegram общие с delivery_engine
+broadcast_engine = DeliveryEngine(
+    workers=BROADCAST_WORKERS,
+    bucket=delivery_engine.bucket,
+    chat_limiter=delivery_engine.chat_limiter,
+)
 
+PROGRESS_INTERVAL = 3  # секунды между обновлениями сообщения с прогрессом
 
-def send_notification_progressively(bot, users, message, admin_id: int, context_name: str):
-    """
-    Асинхронная рассылка сообщений пользователям с отображением прогресса.
-    Может отправлять текст, фото, видео, документы, стикеры и т.д.
-    Работает и с простыми строками, и с объектами Message.
-    """
-    total = len(users)
-    sent = 0
-    update_step = max(1, total // 10)
-    status_msg = bot.send_message(admin_id, f"📤 Начинаю рассылку ({context_name})...\nОтправлено 0 из {total}")
+# job_id → DeliveryRun идущих сейчас рассылок (для отмены из админ-панели)
+_active_runs: dict[int, DeliveryRun] = {}
+_active_runs_lock = Lock()
 
-    is_manual = context_name == "manual_broadcast"
-    prefix = "❗️Новое объявление\n\n" if is_manual else ""
+# admin_id → группы, изменённые по локальному предпросмотру DOCX, и снимок хэшей расписаний до загрузки
+# (для notify_changed:schedule)
+changed_schedule_groups: dict[int, list[str]] = {}
+schedule_snapshots: dict[int, ScheduleSnapshot] = {}
 
-    for u in users:
-        try:
-            uid = u.get("user_id")
-            if not uid:
-                continue
+class AlreadyDelivered(Exception):
+    pass
 
-            # === Если просто текст (строка) ===
-            if isinstance(message, str):
-                bot.send_message(uid, prefix + message)
-                sent += 1
-                continue
+def _resolve_sender(message, prefix: str):
+    """Возвращает (имя метода бота, args, kwargs) для пересылки сообщения или None для неподдерживаемого типа."""
+    # === Если просто текст (строка) ===
+    if isinstance(message, str):
+        return "send_message", [prefix + message], {}
 
-            # === Если Telegram Message ===
-            ctype = message.content_type
-            caption = getattr(message, "caption", None) or ""
-
-            if ctype == "text":
-                bot.send_message(uid, prefix + message.text)
-            elif ctype == "photo":
-                bot.send_photo(uid, message.photo[-1].file_id, caption=prefix + caption)
-            elif ctype == "video":
-                bot.send_video(uid, message.video.file_id, caption=prefix + caption)
-            elif ctype == "document":
-                bot.send_document(uid, message.document.file_id, caption=prefix + caption)
-            elif ctype == "sticker":
-                bot.send_sticker(uid, message.sticker.file_id)
-            elif ctype == "voice":
-                bot.send_voice(uid, message.voice.file_id, caption=prefix + caption)
-            elif ctype == "audio":
-                bot.send_audio(uid, message.audio.file_id, caption=prefix + caption)
-            elif ctype == "animation":
-                bot.send_animation(uid, message.animation.file_id, caption=prefix + caption)
-            else:
-                continue
+    # === Если Telegram Message ===
+    ctype = message.content_type
+    caption = getattr(message, "caption", None) or ""
+
+    if ctype == "text":
+        return "send_message", [prefix + message.text], {}
+    if ctype == "photo":
+        return "send_photo", [message.photo[-1].file_id], {"caption": prefix + caption}
+    if ctype == "video":
+        return "send_video", [message.video.file_id], {"caption": prefix + caption}
+    if ctype == "document":
+        return "send_document", [message.document.file_id], {"caption": prefix + caption}
+    if ctype == "sticker":
+        return "send_sticker", [message.sticker.file_id], {}
+    if ctype == "voice":
+        return "send_voice", [message.voice.file_id], {"caption": prefix + caption}
+    if ctype == "audio":
+        return "send_audio", [message.audio.file_id], {"caption": prefix + caption}
+    if ctype == "animation":
+        return "send_animation", [message.animation.file_id], {"caption": prefix + caption}
+    return None
+
+def _format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} с"
+    return f"{seconds // 60} мин {seconds % 60} с"
 
-            sent += 1
+def _progress_text(context_name: str, sent: int, total: int, run: DeliveryRun) -> str:
+    rate = run.rate
+    eta = (run.total - run.processed) / rate if rate else 0
+    return (
+        f"📨 Рассылка ({context_name})...\n"
+        f"Отправлено {sent} из {total}\n"
+        f"⚡ {rate:.1f} сообщ./с, осталось ~{_format_eta(eta)}"
+    )
 
-        except Exception as e:
-            # можно включить лог для отладки
-            # print(f"Ошибка отправки пользователю {uid}: {e}")
-            continue
+def _cancel_keyboard(job_id: int) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup()
+    kb.add(types.InlineKeyboardButton("⛔ Остановить рассылку", callback_data=f"broadcast_cancel:{job_id}"))
+    return kb
 
-        # обновление статуса прогресса
-        if sent % update_step == 0 or sent == total:
-            try:
-                bot.edit_message_text(
-                    f"📨 Рассылка ({context_name})...\nОтправлено {sent} из {total}",
-                    admin_id,
-                    status_msg.message_id
-                )
-            except:
-                pass
+def _send_tracked(chat_id: int, job_id: int, method, args, kwargs):
+    """Отправка одному получателю с отметкой в хранилище: каждому не больше одного раза."""
+    store = get_broadcast_store()
+    if not store.claim(job_id, chat_id):
+        raise AlreadyDelivered()
+    try:
+        result = method(chat_id, *args, **kwargs)
+    except ApiTelegramException as e:
+        # Telegram ответил ошибкой — сообщение точно не доставлено
+        store.mark(job_id, chat_id, "pending" if retry_after_seconds(e) is not None else "failed")
+        raise
+    except Exception:
+        # Сетевой сбой: доставлено ли сообщение, неизвестно — повторно не шлём
+        store.mark(job_id, chat_id, "unknown")
+        raise
+    store.mark(job_id, chat_id, "sent")
+    return result
 
-        asyncio.run(asyncio.sleep(0.05))
+def _delivery_failed(job_id: int, chat_id: int, error: BaseException):
+    """429 дошёл до сюда — повторы движка исчерпаны, иначе строка так и осталась бы pending."""
+    if retry_after_seconds(error) is not None:
+        get_broadcast_store().mark(job_id, chat_id, "failed")
 
-    bot.send_message(admin_id, f"✅ Рассылка завершена! Отправлено {sent} из {total}.")
+def run_broadcast_job(bot, job_id: int, resumed: bool = False):
+    """Досылает рассылку всем получателям в статусе pending, показывая прогресс администратору."""
+    store = get_broadcast_store()
+    job = store.get_job(job_id)
+    if not job or job["status"] != "running":
+        return
+    admin_id = job["admin_id"]
+    context_name = job["context_name"]
+    method = getattr(bot, job["method"], None)
+
+    counts = store.counts(job_id)
+    total = sum(counts.values())
+    pending = store.pending_deliveries(job_id) if method else []
+    title = "🔄 Возобновляю рассылку" if resumed else "📤 Начинаю рассылку"
+    status_msg = bot.send_message(
+        admin_id,
+        f"{title} ({context_name})...\nОтправлено {counts.get('sent', 0)} из {total}",
+        reply_markup=_cancel_keyboard(job_id),
+    )
+
+    run = broadcast_engine.deliver(
+        [
+            (
+                uid, _send_tracked,
+                (job_id, method, *((own["args"], own["kwargs"]) if own else (job["args"], job["kwargs"]))), {},
+            )
+            for uid, own in pending
+        ],
+        on_error=partial(_delivery_failed, job_id),
+    )
+    with _active_runs_lock:
+        _active_runs[job_id] = run
+
+    # обновление статуса прогресса
+    while not run.done.wait(PROGRESS_INTERVAL):
+        try:
+            bot.edit_message_text(
+                _progress_text(context_name, store.counts(job_id).get("sent", 0), total, run),
+                admin_id,
+                status_msg.message_id,
+                reply_markup=_cancel_keyboard(job_id),
+            )
+        except Exception:
+            pass
+
+    with _active_runs_lock:
+        _active_runs.pop(job_id, None)
+    sent = store.counts(job_id).get("sent", 0)
+    if run.cancelled.is_set():
+        store.finish(job_id, "cancelled")
+        bot.send_message(admin_id, f"⛔ Рассылка остановлена. Отправлено {sent} из {total}.")
+    else:
+        store.finish(job_id, "done")
+        bot.send_message(
+            admin_id,
+            f"✅ Рассылка завершена! Отправлено {sent} из {total}.\n"
+            f"⏱ {_format_eta(run.elapsed)}, {run.rate:.1f} сообщ./с"
+        )
     from bot.handlers.admin import render_admin_panel
     render_admin_panel(admin_id)
 
+def send_notification_progressively(bot, users, message, admin_id: int, context_name: str):
+    """
+    Рассылка сообщений пользователям с отображением прогресса.
+    Может отправлять текст, фото, видео, документы, стикеры и т.д.
+    Работает и с простыми строками, и с объектами Message.
+    Рассылка сохраняется в SQLite и после перезапуска бота продолжается с места остановки.
+    """
+    is_manual = context_name == "manual_broadcast"
+    prefix = "❗️Новое объявление\n\n" if is_manual else ""
+
+    sender = _resolve_sender(message, prefix)
+    # users может быть генератором (iter_users) — страницы читаются до записи в SQLite, в памяти только id
+    recipients = (u.get("user_id") for u in users if u.get("user_id")) if sender else ()
+    method, args, kwargs = sender or ("", [], {})
+    job_id = get_broadcast_store().create_job(admin_id, context_name, method, args, kwargs, recipients)
+    run_broadcast_job(bot, job_id)
+
+def cancel_broadcast(job_id: int) -> bool:
+    store = get_broadcast_store()
+    job = store.get_job(job_id)
+    if not job or job["status"] != "running":
+        return False
+    with _active_runs_lock:
+        run = _active_runs.get(job_id)
+    if run is not None:
+        # Итоговый статус выставит run_broadcast_job, когда очередь опустеет
+        run.cancel()
+    else:
+        store.finish(job_id, "cancelled")
+    return True
+
+def active_broadcasts() -> list[dict]:
+    return get_broadcast_store().active_jobs()
+
+def resume_broadcasts(bot):
+    """Вызывается при старте: продолжает рассылки, прерванные перезапуском."""
+    try:
+        store = get_broadcast_store()
+        store.recover_interrupted()
+        for job in store.active_jobs():
+            Thread(target=run_broadcast_job, args=(bot, job["id"], True), daemon=True).start()
+    except Exception as e:
+        log_error("resume_broadcasts()", e)
+
 
 def handle_mass_notification(call):
     """
@@ -106,7 +239,7 @@ def handle_mass_notification(call):
         return
 
     bot.answer_callback_query(call.id, f"📢 Начинаю уведомление ({context_name})...")
-    users = api_get_users()
+    users = iter_users()
 
     # Текст уведомления
     if context_name == "bell":
@@ -117,3 +250,95 @@ def handle_mass_notification(call):
         msg_text = "📢 Новое обновление в системе!"
 
     Thread(target=send_notification_progressively, args=(bot, users, msg_text, user_id, context_name)).start()
+
+def _changed_schedule_recipients(changes: ScheduleChanges, with_schedule: bool):
+    """(chat_id, args, kwargs) для send_message студентам изменённых групп и их преподавателям; каждому — одно сообщение."""
+    day = get_current_day() or get_tomorrow_day()
+    seen = set()
+    for group in changes.groups:
+        text = f"📚 Изменилось расписание группы {group}!"
+        if with_schedule and day:
+            text += "\n\n" + render_schedule_for_day(group, api_get_schedule(group) or {}, day)
+        for u in api_get_users_by_group(group):
+            uid = u.get("user_id")
+            if uid and uid not in seen and u.get("role", "student") == "student":
+                seen.add(uid)
+                yield uid, [text], {"protect_content": True}
+    if not changes.teacher_keys:
+        return
+    for role in ("teacher", "admin"):
+        for u in api_get_users_by_role(role):
+            uid, fio = u.get("user_id"), u.get("teacher_fio") or ""
+            fio_key = fio_full_to_initials(fio)
+            if not uid or uid in seen or not fio or teacher_key(fio_key) not in changes.teacher_keys:
+                continue
+            seen.add(uid)
+            text = "👨‍🏫 Изменилось расписание ваших занятий!"
+            if with_schedule and day:
+                text += "\n\n" + render_teacher_schedule_for_day(fio, get_teacher_schedule(fio_key) or {}, day)
+            yield uid, [text], {}
+
+def notify_schedule_changes(bot, admin_id: int, before: ScheduleSnapshot | None, fallback_groups: list[str] | None = None):
+    """
+    Сравнивает хэши расписаний групп до и после загрузки и уведомляет только затронутых.
+    Если снимка «до» нет — уведомляет группы из локального предпросмотра DOCX.
+    Группы, которые после загрузки проверить не удалось, уведомляются по предпросмотру DOCX.
+    """
+    if before is not None:
+        changes = detect_changes(before)
+    else:
+        changes = ScheduleChanges(fallback_groups or [], set(), [])
+
+    unknown_text = ""
+    if changes.unknown:
+        # API не отдало расписание — верим локальному разбору файла для этих групп
+        by_preview = [g for g in (fallback_groups or []) if g in changes.unknown and g not in changes.groups]
+        changes.groups.extend(by_preview)
+        for group in by_preview:
+            changes.teacher_keys |= before.teachers.get(group, frozenset())
+        unknown_text = f"\n❔ Не удалось проверить после загрузки: {len(changes.unknown)} гр. ({', '.join(changes.unknown[:10])}{'…' if len(changes.unknown) > 10 else ''})"
+        if by_preview:
+            unknown_text += f"\n📄 Из них изменены по файлу и будут уведомлены: {len(by_preview)}"
+
+    if not changes.groups:
+        if not changes.unknown:
+            bot.send_message(admin_id, "✅ Расписание ни одной группы не изменилось — уведомлять некого.")
+            return
+        # Проверить ничего не удалось — «ничего не изменилось» было бы неправдой, решает администратор
+        kb = types.InlineKeyboardMarkup()
+        kb.add(
+            types.InlineKeyboardButton("✅ Уведомить всех", callback_data="notify_all:schedule"),
+            types.InlineKeyboardButton("🚫 Не уведомлять", callback_data="skip_notify:schedule"),
+        )
+        bot.send_message(
+            admin_id,
+            "⚠️ Не удалось определить, какие группы изменились." + unknown_text,
+            reply_markup=kb,
+        )
+        return
+
+    text = (
+        f"📨 Уведомляю об изменениях: групп {len(changes.groups)}, преподавателей {len(changes.teacher_keys)}"
+        f" ({', '.join(changes.groups[:20])}{'…' if len(changes.groups) > 20 else ''})"
+    ) + unknown_text
+    bot.send_message(admin_id, text)
+
+    # Как обычная рассылка: задание в SQLite переживает перезапуск, его можно остановить из админ-панели
+    recipients = _changed_schedule_recipients(changes, NOTIFY_CHANGES_WITH_SCHEDULE)
+    job_id = get_broadcast_store().create_job(admin_id, "changed_schedule", "send_message", [], {}, recipients)
+    run_broadcast_job(bot, job_id)
+
+def handle_changed_groups_notification(call):
+    """Уведомление только затронутых загрузкой групп и преподавателей (callback notify_changed:schedule)."""
+    user_id = call.from_user.id
+    if not is_admin(user_id):
+        bot.answer_callback_query(call.id, "❌ Нет прав.")
+        return
+    before = schedule_snapshots.pop(user_id, None)
+    groups = changed_schedule_groups.pop(user_id, None)
+    if before is None and not groups:
+        bot.answer_callback_query(call.id, "⚠️ Список изменённых групп устарел — загрузите расписание заново.")
+        return
+
+    bot.answer_callback_query(call.id, "🔍 Проверяю, какие группы изменились...")
+    Thread(target=notify_schedule_changes, args=(bot, user_id, before, groups), daemon=True).start()
@@ -0,0 +1,29 @@
+import itertools
+from typing import Any, Optional
+from .cache import TTLCache
+
+class PageSnapshots:
+    """
+    Снимки списков для постраничного просмотра в админке.
+    Список собирается и сортируется один раз при открытии, дальше кнопки ⬅️/➡️
+    ссылаются на снимок по id из callback_data — страницы не «съезжают» между нажатиями.
+    Снимок привязан к админу, который его открыл, и живёт ttl секунд с последнего обращения.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 256):
+        self._cache = TTLCache(ttl, maxsize=maxsize, name="page_snapshots")
+        self._ids = itertools.count(1)
+
+    def create(self, owner_id: int, payload: Any) -> int:
+        snapshot_id = next(self._ids)
+        self._cache.set((int(owner_id), snapshot_id), payload)
+        return snapshot_id
+
+    def get(self, owner_id: int, snapshot_id: Optional[int]) -> Any:
+        if snapshot_id is None:
+            return None
+        payload = self._cache.get((int(owner_id), snapshot_id))
+        if payload is not None:
+            # продлеваем жизнь снимка, пока его листают
+            self._cache.set((int(owner_id), snapshot_id), payload)
+        return payload
@@ -0,0 +1,98 @@
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+from config import DAYS_RU, SCHEDULE_CACHE_TTL, RENDER_CACHE_SIZE
+from .api import api_get_schedule
+from .cache import TTLCache
+from .fio_utils import fio_full_to_initials
+from .schedule_utils import format_schedule_for_day, format_teacher_schedule_for_day
+from .teacher_index import get_teacher_schedule
+
+# Готовый текст расписания: ключ (вид, группа/ФИО, день, хэш документа).
+# Хэш считается по содержимому, поэтому после загрузки нового расписания старые записи
+# просто перестают совпадать и вытесняются сами — явная инвалидация не нужна.
+_rendered = TTLCache(SCHEDULE_CACHE_TTL, maxsize=RENDER_CACHE_SIZE, name="rendered")
+
+# (вид, группа/ФИО) → (последний документ, его хэш). Пока из кэша api.py приходит тот же объект,
+# хэш не пересчитывается; пришёл другой документ — запись просто перезаписывается.
+_digests = TTLCache(SCHEDULE_CACHE_TTL, maxsize=RENDER_CACHE_SIZE, name="schedule_digests")
+
+# Какие расписания открывали пользователи — их прогреваем после загрузки нового файла.
+# Не больше RENDER_CACHE_SIZE ключей: давно не открывавшиеся вытесняются первыми
+_seen_lock = Lock()
+_seen: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+
+WEEK_DAYS = DAYS_RU[:6]
+
+def schedule_digest(doc: Dict[str, Any], key: Optional[Hashable] = None) -> str:
+    """sha1 содержимого документа; с key — запоминается для повторных вызовов с тем же объектом."""
+    if key is not None:
+        entry = _digests.get(key)
+        if entry is not None and entry[0] is doc:
+            return entry[1]
+    digest = hashlib.sha1(
+        json.dumps(doc, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+    if key is not None:
+        _digests.set(key, (doc, digest))
+    return digest
+
+def _mark_seen(key: Tuple[str, str]):
+    with _seen_lock:
+        _seen[key] = None
+        _seen.move_to_end(key)
+        while len(_seen) > RENDER_CACHE_SIZE:
+            _seen.popitem(last=False)
+
+def _render(kind: str, name: str, doc: Optional[Dict[str, Any]], day: str) -> str:
+    if kind == "teacher":
+        return format_teacher_schedule_for_day(name, doc or {}, day)
+    return format_schedule_for_day(name, doc or {}, day)
+
+def _render_cached(kind: str, name: str, doc: Optional[Dict[str, Any]], day: str) -> str:
+    if not doc or not name:
+        # «не найдено» / «не указано» — дешёвые ответы, не кэшируем
+        return _render(kind, name, doc, day)
+    key = (kind, name, day, schedule_digest(doc, key=(kind, name)))
+    text = _rendered.get(key)
+    if text is None:
+        text = _render(kind, name, doc, day)
+        _rendered.set(key, text)
+    return text
+
+def render_schedule_for_day(group_name: str, schedule_doc: Optional[Dict[str, Any]], day: str) -> str:
+    """То же, что format_schedule_for_day, но повторные запросы отдаются из кэша."""
+    _mark_seen(("group", group_name))
+    return _render_cached("group", group_name, schedule_doc, day)
+
+def render_teacher_schedule_for_day(teacher_full_fio: str, schedule_doc: Optional[Dict[str, Any]], day: str) -> str:
+    """То же, что format_teacher_schedule_for_day, но повторные запросы отдаются из кэша."""
+    _mark_seen(("teacher", teacher_full_fio))
+    return _render_cached("teacher", teacher_full_fio, schedule_doc, day)
+
+def prerender_week(kind: str, name: str, doc: Optional[Dict[str, Any]], days: Iterable[str] = WEEK_DAYS) -> int:
+    """Заранее рендерит все учебные дни для одного расписания; возвращает число отрендеренных дней."""
+    if not doc or not name:
+        return 0
+    count = 0
+    for day in days:
+        _render_cached(kind, name, doc, day)
+        count += 1
+    return count
+
+def seen_schedule_keys() -> List[Tuple[str, str]]:
+    with _seen_lock:
+        return list(_seen)
+
+def warm_schedule(kind: str, name: str) -> bool:
+    """Загружает расписание ('group', имя) / ('teacher', ФИО) и рендерит его на всю неделю."""
+    if kind == "teacher":
+        doc = get_teacher_schedule(fio_full_to_initials(name))
+    else:
+        doc = api_get_schedule(name)
+    return prerender_week(kind, name, doc) > 0
+
+def render_cache_stats() -> Dict[str, Any]:
+    return _rendered.stats()
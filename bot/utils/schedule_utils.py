@@ -127,7 +127,8 @@ def format_teacher_schedule_for_day(teacher_full_fio: str, schedule_doc: Dict[st
 
         for num, info in sorted(day_dict.items(), key=lambda x: lesson_sort_key(x[0])):
             subject = info.get('subject', '')
-            group = info.get('group', '')
+            # Индекс преподавателей хранит группы потока списком, API — строкой
+            group = ", ".join(info['groups']) if info.get('groups') else info.get('group', '')
             room = info.get('classroom', '')
             time_str = info.get('time')
 
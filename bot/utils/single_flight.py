@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Склейка одинаковых одновременных вызовов: пока по ключу идёт вызов, остальные потоки
+    с тем же ключом не повторяют его, а ждут и получают тот же результат (или то же исключение).
+    Ничего не кэширует — после завершения вызова следующий снова пойдёт в функцию.
+    Для ключей, где склейка была, ведётся счётчик (не больше maxsize ключей, LRU).
+    """
+
+    def __init__(self, name: str = "single-flight", maxsize: int = 512):
+        self.name = name
+        self.maxsize = maxsize
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._per_key: "OrderedDict[Hashable, int]" = OrderedDict()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self._per_key[key] = self._per_key.pop(key, 0) + 1
+                while len(self._per_key) > self.maxsize:
+                    self._per_key.popitem(last=False)
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            busiest = sorted(self._per_key.items(), key=lambda kv: kv[1], reverse=True)[:top]
+            return {
+                "name": self.name,
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "top": [(str(k), n) for k, n in busiest],
+            }
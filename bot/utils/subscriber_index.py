@@ -0,0 +1,81 @@
+import re
+import time
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+DEFAULT_SCHEDULE_TIME = "08:00"
+
+def normalize_schedule_time(value: Optional[str]) -> Optional[str]:
+    """'8:00' / '08:00' / '08:00:00' → '08:00'; мусор → None."""
+    m = re.match(r"^\s*(\d{1,2}):(\d{2})", value or DEFAULT_SCHEDULE_TIME)
+    if not m:
+        return None
+    hours, minutes = int(m.group(1)), int(m.group(2))
+    if hours > 23 or minutes > 59:
+        return None
+    return f"{hours:02d}:{minutes:02d}"
+
+class SubscriberIndex:
+    """
+    Подписчики ежедневной рассылки, разложенные по минутам schedule_time ('HH:MM' → пользователи).
+    Полностью обновляется периодической выгрузкой подписчиков, между выгрузками —
+    ответами api_update_user (смена времени, включение и отключение рассылки).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._users: Dict[int, Dict[str, Any]] = {}
+        self._minute_of: Dict[int, str] = {}
+        self._buckets: Dict[str, Set[int]] = {}
+        self.loaded_at = 0.0
+
+    def _remove_locked(self, uid: int):
+        minute = self._minute_of.pop(uid, None)
+        self._users.pop(uid, None)
+        if minute is not None:
+            bucket = self._buckets.get(minute)
+            if bucket is not None:
+                bucket.discard(uid)
+                if not bucket:
+                    del self._buckets[minute]
+
+    def _apply_locked(self, user: Dict[str, Any]):
+        uid = user.get("user_id")
+        if uid is None:
+            return
+        self._remove_locked(uid)
+        minute = normalize_schedule_time(user.get("schedule_time"))
+        if not user.get("schedule_enabled") or minute is None:
+            return
+        self._users[uid] = user
+        self._minute_of[uid] = minute
+        self._buckets.setdefault(minute, set()).add(uid)
+
+    def replace(self, users: Iterable[Dict[str, Any]]):
+        with self._lock:
+            self._users, self._minute_of, self._buckets = {}, {}, {}
+            for u in users:
+                self._apply_locked(u)
+            self.loaded_at = time.monotonic()
+
+    def apply(self, user: Dict[str, Any]):
+        """Учесть свежее состояние пользователя (до первой выгрузки ничего не делает)."""
+        if not self.loaded_at:
+            return
+        with self._lock:
+            self._apply_locked(user)
+
+    def bucket(self, minute: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._users[uid] for uid in self._buckets.get(minute, ())]
+
+    def minutes(self) -> List[str]:
+        """Минуты, на которые есть хотя бы один подписчик, по порядку."""
+        with self._lock:
+            return sorted(self._buckets)
+
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+    def __len__(self) -> int:
+        return len(self._users)
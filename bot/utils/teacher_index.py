@@ -0,0 +1,171 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional
+from config import SCHEDULE_CACHE_TTL, WARMUP_WORKERS
+from .api import api_get_group_catalogue, api_get_schedule, api_get_teacher_schedule, schedule_version
+from .logger import log_error
+from .schedule_utils import lesson_sort_key
+
+# Расписания преподавателей, собранные из расписаний групп:
+#   инициалы → смена → день → номер пары → {subject, groups, classroom, time}
+# Пока индекс актуален, расписание преподавателя отдаётся без отдельного запроса к API;
+# пока он строится (или не собрался целиком) — используется api_get_teacher_schedule.
+
+# «Корнеева А.А.», «Кофанов \nА.А.» — фамилия и инициалы, возможно разорванные пробелами
+TEACHER_RE = re.compile(r"([А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?)\s*([А-ЯЁ])\.\s*(?:([А-ЯЁ])\.?)?")
+
+SHIFTS = ("first_shift", "second_shift")
+
+def teacher_key(initials: str) -> str:
+    """Ключ для сравнения инициалов: без пробелов, в нижнем регистре, ё → е."""
+    return re.sub(r"\s+", "", initials or "").lower().replace("ё", "е")
+
+def teachers_in(cell: str) -> List[str]:
+    return [teacher_key(f"{fam} {a}.{b + '.' if b else ''}") for fam, a, b in TEACHER_RE.findall(cell or "")]
+
+def _group_shift(doc: Dict[str, Any]) -> Optional[str]:
+    """Смена группы, если документ её явно указывает; None — неизвестна."""
+    # Смены приходят отдельным group_shifts.json, в документе группы их обычно нет
+    shift = doc.get("shift", (doc.get("schedule") or {}).get("shift"))
+    value = str(shift).strip().lower() if shift is not None else ""
+    if value in ("1", "first", "first_shift", "первая"):
+        return "first_shift"
+    if value in ("2", "second", "second_shift", "вторая"):
+        return "second_shift"
+    return None
+
+class TeacherIndex:
+    def __init__(self, group_docs: Dict[str, Dict[str, Any]], version: int, catalogue_revision: int):
+        self.version = version
+        self.catalogue_revision = catalogue_revision
+        self.built_at = time.monotonic()
+        index: Dict[str, Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]] = {}
+        # Преподаватели, чьё расписание индекс честно собрать не может: в одну пару стоят разные
+        # занятия или смена хотя бы одной их группы неизвестна. Для них get() вернёт None и ответит API
+        conflicted = set()
+
+        for group, doc in group_docs.items():
+            schedule = doc.get("schedule") or {}
+            shift = _group_shift(doc)
+            lessons = [
+                (day, "0", info)
+                for day, info in (schedule.get("zero_lesson") or {}).items() if info
+            ] + [
+                (day, num, info)
+                for day, day_lessons in (schedule.get("days") or {}).items()
+                for num, info in (day_lessons or {}).items()
+            ]
+            for day, num, info in lessons:
+                if not info.get("subject"):
+                    continue
+                for key in teachers_in(info.get("teacher", "")):
+                    if shift is None:
+                        # Без смены пары нельзя ни разнести по сменам, ни сверить как поток
+                        conflicted.add(key)
+                        continue
+                    day_dict = index.setdefault(key, {}).setdefault(shift, {}).setdefault(day, {})
+                    existing = day_dict.get(num)
+                    if existing is not None:
+                        # Поток: одна и та же пара у нескольких групп той же смены
+                        if (existing["subject"], existing["time"]) == (info.get("subject", ""), info.get("time")):
+                            existing["groups"].append(group)
+                        else:
+                            conflicted.add(key)
+                        continue
+                    day_dict[num] = {
+                        "subject": info.get("subject", ""),
+                        # Список, а не строка: группы потока по отдельности нужны кнопкам «Мои занятия»
+                        "groups": [group],
+                        "classroom": info.get("classroom", ""),
+                        "time": info.get("time"),
+                    }
+
+        # Документы в том же виде, что отдаёт /schedule/teacher/{fio_key}; объекты не меняются,
+        # поэтому хэш для кэша отрендеренного текста считается по каждому один раз
+        self._docs = {
+            key: {"schedule": {
+                shift: {
+                    day: dict(sorted(day_dict.items(), key=lambda x: lesson_sort_key(x[0])))
+                    for day, day_dict in shifts[shift].items()
+                }
+                for shift in SHIFTS if shift in shifts
+            }}
+            for key, shifts in index.items() if key not in conflicted
+        }
+
+    def get(self, fio_key: str) -> Optional[Dict[str, Any]]:
+        """Расписание из индекса; None — преподавателя в индексе нет (или собрать его не удалось)."""
+        return self._docs.get(teacher_key(fio_key))
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+_index: Optional[TeacherIndex] = None
+_index_lock = Lock()
+_building = False
+
+def _is_fresh(idx: Optional[TeacherIndex]) -> bool:
+    return (
+        idx is not None
+        and idx.version == schedule_version()
+        and idx.catalogue_revision == api_get_group_catalogue().revision
+        and time.monotonic() - idx.built_at < SCHEDULE_CACHE_TTL
+    )
+
+def build_teacher_index() -> Optional[TeacherIndex]:
+    """Собирает индекс по всем группам каталога; при неполных данных возвращает None."""
+    global _index
+    version = schedule_version()
+    catalogue = api_get_group_catalogue()
+    if not catalogue:
+        return None
+    groups = list(catalogue.groups)
+    with ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="teacher-index") as pool:
+        docs = dict(zip(groups, pool.map(api_get_schedule, groups)))
+    missing = [g for g, doc in docs.items() if doc is None]
+    if missing:
+        print(f"[WARN] Индекс преподавателей не собран: нет расписания для {len(missing)} групп ({', '.join(missing[:5])})")
+        return None
+    idx = TeacherIndex(docs, version, catalogue.revision)
+    with _index_lock:
+        # Пока собирали, могли загрузить новое расписание — такой индекс уже устарел
+        if version == schedule_version():
+            _index = idx
+    print(f"📇 Индекс преподавателей: {len(idx)} преподавателей из {len(groups)} групп")
+    return idx
+
+def _build_in_background():
+    global _building
+    try:
+        build_teacher_index()
+    except Exception as e:
+        log_error("build_teacher_index()", e)
+    finally:
+        with _index_lock:
+            _building = False
+
+def current_teacher_index(block: bool = False) -> Optional[TeacherIndex]:
+    """Актуальный индекс или None; устаревший индекс перестраивается (в фоне, если block=False)."""
+    global _building
+    idx = _index
+    if _is_fresh(idx):
+        return idx
+    if block:
+        return build_teacher_index()
+    with _index_lock:
+        if _building:
+            return None
+        _building = True
+    Thread(target=_build_in_background, name="teacher-index", daemon=True).start()
+    return None
+
+def get_teacher_schedule(fio_key: str) -> Optional[Dict[str, Any]]:
+    """Замена api_get_teacher_schedule: из локального индекса, а пока его нет — из API."""
+    idx = current_teacher_index()
+    doc = idx.get(fio_key) if idx is not None else None
+    if doc is not None:
+        return doc
+    # Нет в индексе — например, в ячейках записан с одним инициалом, который TEACHER_RE не узнаёт
+    return api_get_teacher_schedule(fio_key)
@@ -0,0 +1,45 @@
+from typing import Any, Dict, Optional
+from config import ADMINS
+from .api import api_get_user, api_update_user
+
+class UserContext:
+    """
+    Данные пользователя, полученные один раз на обработку апдейта.
+    Передаётся в хэндлеры, клавиатуры и панели вместо повторных api_get_user / is_admin / is_teacher.
+    """
+
+    def __init__(self, user_id: int, user: Optional[Dict[str, Any]]):
+        self.user_id = int(user_id)
+        self.user: Dict[str, Any] = user or {}
+
+    @property
+    def exists(self) -> bool:
+        return bool(self.user)
+
+    @property
+    def role(self) -> str:
+        return self.user.get('role', 'student')
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == 'admin'
+
+    @property
+    def is_teacher(self) -> bool:
+        return self.role in ('teacher', 'admin')
+
+    @property
+    def group_name(self) -> Optional[str]:
+        return self.user.get('group_name')
+
+    @property
+    def teacher_fio(self) -> Optional[str]:
+        return self.user.get('teacher_fio')
+
+def get_user_context(user_id: int) -> UserContext:
+    user_id = int(user_id)
+    user = api_get_user(user_id) or {}
+    # Пользователи из ADMINS всегда администраторы — синхронизируем роль на сервере
+    if user_id in ADMINS and user.get('role') != 'admin':
+        user = api_update_user(user_id, {"role": "admin"}) or {**user, "role": "admin"}
+    return UserContext(user_id, user)
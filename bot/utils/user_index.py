@@ -0,0 +1,62 @@
+import time
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+def user_matches(u: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    for key, value in filters.items():
+        if key == "schedule_enabled":
+            if bool(u.get(key)) != bool(value):
+                return False
+        elif u.get(key) != value:
+            return False
+    return True
+
+class UserIndex:
+    """
+    Локальная копия списка пользователей с индексом по группе.
+    Используется, когда сервер не умеет фильтровать выборку сам;
+    обновляется полной выгрузкой и точечно — ответами api_create_user / api_update_user.
+    """
+
+    def __init__(self, users: Iterable[Dict[str, Any]] = ()):
+        self._lock = Lock()
+        self._users: Dict[int, Dict[str, Any]] = {}
+        self._by_group: Dict[str, Set[int]] = {}
+        self.loaded_at = 0.0
+        self.replace(users)
+
+    def replace(self, users: Iterable[Dict[str, Any]]):
+        with self._lock:
+            self._users = {}
+            self._by_group = {}
+            for u in users:
+                self._upsert_locked(u)
+            self.loaded_at = time.monotonic()
+
+    def _upsert_locked(self, user: Dict[str, Any]):
+        uid = user.get("user_id")
+        if uid is None:
+            return
+        old = self._users.get(uid)
+        if old is not None and old.get("group_name") != user.get("group_name"):
+            self._by_group.get(old.get("group_name"), set()).discard(uid)
+        self._users[uid] = user
+        self._by_group.setdefault(user.get("group_name"), set()).add(uid)
+
+    def upsert(self, user: Dict[str, Any]):
+        with self._lock:
+            self._upsert_locked(user)
+
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+    def query(self, group_name: Optional[str] = None, **filters: Any) -> List[Dict[str, Any]]:
+        with self._lock:
+            if group_name is not None:
+                candidates = [self._users[uid] for uid in self._by_group.get(group_name, ())]
+            else:
+                candidates = list(self._users.values())
+        return [u for u in candidates if user_matches(u, filters)]
+
+    def __len__(self) -> int:
+        return len(self._users)
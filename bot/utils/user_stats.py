@@ -0,0 +1,105 @@
+import re
+import time
+from collections import Counter
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+NO_GROUP = "без группы"
+
+# Что из пользователя влияет на статистику: роль, группа, подписка
+_Key = Tuple[Optional[str], str, bool]
+
+def _stats_key(u: Dict[str, Any]) -> _Key:
+    return (u.get("role"), (u.get("group_name") or "").strip(), bool(u.get("schedule_enabled")))
+
+def _group_sort_key(item: Tuple[str, int]):
+    name = item[0]
+    if name == NO_GROUP:
+        return (9999, "ЯЯЯ")  # в самый конец
+    m = re.match(r"(\d+)", name)
+    num = int(m.group(1)) if m else 0
+    letters = re.sub(r"^\d+", "", name)
+    return (num, letters.upper())
+
+class UserStats:
+    """
+    Счётчики для админской статистики, которые не нужно пересчитывать по всему списку пользователей.
+    Полностью строятся через reconcile() (периодически и при полной выгрузке),
+    между сверками обновляются по ответам api_get_user / api_create_user / api_update_user.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._keys: Dict[int, _Key] = {}
+        self._roles: Counter = Counter()
+        self._groups: Counter = Counter()          # все пользователи с группой
+        self._student_groups: Counter = Counter()  # только студенты, пустая группа → NO_GROUP
+        self._subs = 0
+        self._sorted_groups: Optional[List[Tuple[str, int]]] = None
+        self.loaded_at = 0.0
+
+    def _apply_locked(self, key: _Key, sign: int):
+        role, group, subscribed = key
+        self._roles[role] += sign
+        if group:
+            self._groups[group] += sign
+            if self._groups[group] <= 0:
+                del self._groups[group]
+        if role == "student":
+            name = group or NO_GROUP
+            self._student_groups[name] += sign
+            if self._student_groups[name] <= 0:
+                del self._student_groups[name]
+        if subscribed:
+            self._subs += sign
+        self._sorted_groups = None
+
+    def reconcile(self, users: Iterable[Dict[str, Any]]):
+        # users может быть потоковым генератором: сначала он выбирается целиком в компактные ключи
+        keys = {u["user_id"]: _stats_key(u) for u in users if u.get("user_id") is not None}
+        with self._lock:
+            self._keys = {}
+            self._roles = Counter()
+            self._groups = Counter()
+            self._student_groups = Counter()
+            self._subs = 0
+            for uid, key in keys.items():
+                self._keys[uid] = key
+                self._apply_locked(key, +1)
+            self.loaded_at = time.monotonic()
+
+    def apply(self, user: Dict[str, Any]):
+        """Учесть свежее состояние одного пользователя (до первой сверки ничего не делает)."""
+        uid = user.get("user_id")
+        if uid is None or not self.loaded_at:
+            return
+        key = _stats_key(user)
+        with self._lock:
+            old = self._keys.get(uid)
+            if old == key:
+                return
+            if old is not None:
+                self._apply_locked(old, -1)
+            self._keys[uid] = key
+            self._apply_locked(key, +1)
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "total": len(self._keys),
+                "students": self._roles["student"],
+                "teachers": self._roles["teacher"],
+                "admins": self._roles["admin"],
+                "groups": len(self._groups),
+                "subs": self._subs,
+            }
+
+    def student_groups(self) -> List[Tuple[str, int]]:
+        """Студенты по группам, отсортировано; список пересобирается только после изменений."""
+        with self._lock:
+            if self._sorted_groups is None:
+                self._sorted_groups = sorted(self._student_groups.items(), key=_group_sort_key)
+            return self._sorted_groups
+
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
@@ -0,0 +1,100 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Thread
+from typing import Dict, List, Tuple
+from config import WARMUP_WORKERS
+from .api import api_get_all_groups, api_get_users_by_role
+from .logger import log_error
+from .render_cache import WEEK_DAYS, seen_schedule_keys, warm_schedule
+from .teacher_index import current_teacher_index
+
+# Прогрев после загрузки нового расписания: все группы и все преподаватели
+# скачиваются ограниченным пулом и рендерятся на неделю вперёд,
+# чтобы первый пользователь каждой группы не ждал запроса к API и форматирования.
+
+PROGRESS_INTERVAL = 3  # секунды между обновлениями сообщения с прогрессом
+
+def schedule_warm_keys() -> List[Tuple[str, str]]:
+    keys: Dict[Tuple[str, str], None] = {}
+    for group in api_get_all_groups():
+        keys[("group", group)] = None
+    # Админы с ФИО получают расписание преподавателя так же, как преподаватели
+    for role in ("teacher", "admin"):
+        for u in api_get_users_by_role(role):
+            if u.get("teacher_fio"):
+                keys[("teacher", u["teacher_fio"])] = None
+    # Плюс то, что пользователи уже открывали (например, группы, пропавшие из списка)
+    for key in seen_schedule_keys():
+        keys.setdefault(key, None)
+    return list(keys)
+
+def _warm_one(key: Tuple[str, str]) -> bool:
+    try:
+        return warm_schedule(*key)
+    except Exception as e:
+        log_error(f"warm_schedule({key})", e)
+        return False
+
+def _progress_text(done: int, total: int, started: float) -> str:
+    return (
+        f"🔥 Прогрев кэша расписаний...\n"
+        f"Готово {done} из {total} ({len(WEEK_DAYS)} дн. на каждое расписание)\n"
+        f"⏱ {int(time.monotonic() - started)} с"
+    )
+
+def run_schedule_warmup(bot, admin_id: int):
+    started = time.monotonic()
+    try:
+        keys = schedule_warm_keys()
+    except Exception as e:
+        log_error("schedule_warm_keys()", e)
+        return
+    total = len(keys)
+    if not total:
+        return
+    status_msg = bot.send_message(admin_id, _progress_text(0, total, started))
+
+    warmed = {"group": 0, "teacher": 0}
+    failed = 0
+    done = 0
+    last_report = time.monotonic()
+    with ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="warmup") as pool:
+        # Сначала группы: из их расписаний собирается индекс преподавателей,
+        # и расписания преподавателей дальше рендерятся уже без запросов к API
+        for phase in ("group", "teacher"):
+            if phase == "teacher":
+                try:
+                    current_teacher_index(block=True)
+                except Exception as e:
+                    log_error("current_teacher_index()", e)
+            pending = {pool.submit(_warm_one, key): key for key in keys if key[0] == phase}
+            while pending:
+                finished, _ = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    pending.pop(future)
+                    done += 1
+                    if future.result():
+                        warmed[phase] += 1
+                    else:
+                        failed += 1
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    try:
+                        bot.edit_message_text(_progress_text(done, total, started), admin_id, status_msg.message_id)
+                    except Exception:
+                        pass
+
+    summary = (
+        f"✅ Кэш расписаний прогрет за {int(time.monotonic() - started)} с\n"
+        f"👨‍🎓 Групп: {warmed['group']}\n"
+        f"👨‍🏫 Преподавателей: {warmed['teacher']}"
+    )
+    if failed:
+        summary += f"\n⚠️ Без расписания или с ошибкой: {failed}"
+    try:
+        bot.edit_message_text(summary, admin_id, status_msg.message_id)
+    except Exception:
+        bot.send_message(admin_id, summary)
+
+def start_schedule_warmup(bot, admin_id: int):
+    Thread(target=run_schedule_warmup, args=(bot, admin_id), name="schedule-warmup", daemon=True).start()
@@ -0,0 +1,114 @@
+import hmac
+import json
+import queue
+import secrets
+import signal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from telebot import types
+from config import (
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE
+)
+from bot.core import bot
+from bot.utils.logger import log_error
+
+# Режим BOT_MODE=webhook: Telegram сам присылает апдейты POST-запросом на локальный HTTP-сервер.
+# Сервер только кладёт апдейт в ограниченную очередь и сразу отвечает 200,
+# отдельный поток передаёт апдейты в bot.process_new_updates (дальше — пул обработчиков).
+# Если очередь переполнена, отвечаем 503 — Telegram повторит доставку позже.
+
+_updates: "queue.Queue[types.Update]" = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+
+# Секрет проверяется всегда: без него любой, кто достучится до порта, мог бы подделать апдейт
+# от имени админа. Если WEBHOOK_SECRET не задан, генерируем свой на запуск и передаём его в set_webhook
+_secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+_stopping = Event()
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != WEBHOOK_PATH:
+            self.send_response(404)
+            self.end_headers()
+            return
+        token = self.headers.get("X-Telegram-Bot-Api-Secret-Token") or ""
+        if not hmac.compare_digest(token.encode(), _secret.encode()):
+            self.send_response(403)
+            self.end_headers()
+            return
+        if _stopping.is_set():
+            self.send_response(503)
+            self.end_headers()
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            update = types.Update.de_json(json.loads(self.rfile.read(length).decode("utf-8")))
+        except Exception as e:
+            log_error("webhook: разбор апдейта", e)
+            self.send_response(400)
+            self.end_headers()
+            return
+        try:
+            _updates.put_nowait(update)
+        except queue.Full:
+            print(f"[WARN] Очередь webhook переполнена ({WEBHOOK_QUEUE_SIZE}), апдейт {update.update_id} отклонён")
+            self.send_response(503)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.end_headers()
+
+    def do_GET(self):
+        # healthcheck
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(f"ok, queue={_updates.qsize()}".encode())
+
+    def log_message(self, format, *args):
+        pass
+
+def _feed_updates():
+    while not (_stopping.is_set() and _updates.empty()):
+        try:
+            update = _updates.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        try:
+            bot.process_new_updates([update])
+        except Exception as e:
+            log_error("webhook: process_new_updates", e)
+
+def run_webhook():
+    if not WEBHOOK_URL:
+        print("❌ Для BOT_MODE=webhook нужно указать WEBHOOK_URL")
+        raise SystemExit(1)
+    server = ThreadingHTTPServer((WEBHOOK_LISTEN, WEBHOOK_PORT), _WebhookHandler)
+    server.daemon_threads = True
+    feeder = Thread(target=_feed_updates, name="webhook-feeder", daemon=True)
+    feeder.start()
+
+    def _shutdown(signum, frame):
+        print("🛑 Остановка webhook-сервера...")
+        _stopping.set()
+        # shutdown() ждёт выхода из serve_forever, поэтому вызываем его не из главного потока
+        Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=_secret,
+        allowed_updates=["message", "callback_query"],
+    )
+    if not WEBHOOK_SECRET:
+        print("[WARN] WEBHOOK_SECRET не задан — используется случайный секрет, действующий до перезапуска")
+    print(f"🌐 Webhook слушает {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        server.serve_forever()
+    finally:
+        _stopping.set()
+        server.server_close()
+        # Дорабатываем уже принятые апдейты и ждём обработчики
+        feeder.join(timeout=30)
+        bot.worker_pool.close()
+        print("✅ Webhook-сервер остановлен")
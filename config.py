@@ -10,6 +10,54 @@ TZ: str = os.getenv("TZ", "Asia/Yekaterinburg")
 
 PLATFORM = "telegram"
 
+# Update processing mode: "polling" (sync TeleBot) or "webhook" (local HTTP server)
+BOT_MODE: str = os.getenv("BOT_MODE", "polling").lower()
+
+# Webhook mode
+WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")  # public https base URL, e.g. https://bot.example.com
+WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# Update dispatch (sync TeleBot): worker threads and max queued updates before polling is paused
+HANDLER_THREADS: int = int(os.getenv("HANDLER_THREADS", "8"))
+HANDLER_QUEUE_LIMIT: int = int(os.getenv("HANDLER_QUEUE_LIMIT", "500"))
+
+# Caches (seconds)
+USER_CACHE_TTL: int = int(os.getenv("USER_CACHE_TTL", "30"))
+SCHEDULE_CACHE_TTL: int = int(os.getenv("SCHEDULE_CACHE_TTL", "900"))
+SCHEDULE_CACHE_SIZE: int = int(os.getenv("SCHEDULE_CACHE_SIZE", "512"))
+RENDER_CACHE_SIZE: int = int(os.getenv("RENDER_CACHE_SIZE", "4096"))
+WARMUP_WORKERS: int = int(os.getenv("WARMUP_WORKERS", "4"))
+NOTIFY_CHANGES_WITH_SCHEDULE: bool = os.getenv("NOTIFY_CHANGES_WITH_SCHEDULE", "true").lower() in ("1", "true", "yes")
+GROUPS_CACHE_TTL: int = int(os.getenv("GROUPS_CACHE_TTL", "600"))
+# Последнее удачное расписание отдаётся, пока API недоступно, не дольше этого срока
+SCHEDULE_STALE_TTL: int = int(os.getenv("SCHEDULE_STALE_TTL", "86400"))
+
+# Backend API client: connect timeout and circuit breaker (failures in a row → pause in seconds)
+API_CONNECT_TIMEOUT: float = float(os.getenv("API_CONNECT_TIMEOUT", "3"))
+API_READ_TIMEOUT: float = float(os.getenv("API_READ_TIMEOUT", "8"))  # GET; запись ждёт дольше
+API_BREAKER_FAILURES: int = int(os.getenv("API_BREAKER_FAILURES", "5"))
+API_BREAKER_RESET: int = int(os.getenv("API_BREAKER_RESET", "30"))
+USER_INDEX_TTL: int = int(os.getenv("USER_INDEX_TTL", "300"))
+USERS_PAGE_SIZE: int = int(os.getenv("USERS_PAGE_SIZE", "500"))
+STATS_RECONCILE_INTERVAL: int = int(os.getenv("STATS_RECONCILE_INTERVAL", "600"))
+PAGING_SNAPSHOT_TTL: int = int(os.getenv("PAGING_SNAPSHOT_TTL", "300"))
+# Индекс подписчиков ежедневной рассылки: период полной перезагрузки и сколько минут догонять после простоя
+SUBSCRIBER_REFRESH_INTERVAL: int = int(os.getenv("SUBSCRIBER_REFRESH_INTERVAL", "300"))
+DAILY_CATCHUP_MINUTES: int = int(os.getenv("DAILY_CATCHUP_MINUTES", "30"))
+# За сколько минут до времени рассылки готовить её тексты заранее
+DAILY_PRERENDER_MINUTES: int = int(os.getenv("DAILY_PRERENDER_MINUTES", "3"))
+
+# Telegram delivery limits
+DELIVERY_WORKERS: int = int(os.getenv("DELIVERY_WORKERS", "8"))
+TELEGRAM_GLOBAL_RATE: float = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_PER_CHAT_INTERVAL: float = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", "1.0"))
+BROADCAST_WORKERS: int = int(os.getenv("BROADCAST_WORKERS", "16"))
+BROADCAST_DB_PATH: str = os.getenv("BROADCAST_DB_PATH", "data/broadcasts.sqlite3")
+
 # Roles
 ROLES = {
     'student': '👨‍🎓 Студент',
@@ -2,16 +2,18 @@ import time
 from bot.core import bot as telegram_bot
 from bot.utils.api import check_api_connection
 from scheduler import attach_and_start_scheduler
+from config import BOT_MODE
 
 if __name__ == "__main__":
     print("🤖 Бот запущен!")
     check_api_connection()
 
-    try:
-        telegram_bot.remove_webhook()
-        time.sleep(1)
-    except Exception as e:
-        print("remove_webhook error:", e)
+    if BOT_MODE != "webhook":
+        try:
+            telegram_bot.remove_webhook()
+            time.sleep(1)
+        except Exception as e:
+            print("remove_webhook error:", e)
 
     # Start APScheduler
     attach_and_start_scheduler()
@@ -23,7 +25,21 @@ if __name__ == "__main__":
     import bot.handlers.callbacks # noqa
     import bot.handlers.text      # noqa
 
+    # Продолжаем рассылки, прерванные перезапуском контейнера
+    from bot.utils.notifications import resume_broadcasts
+    resume_broadcasts(telegram_bot)
+
+    if BOT_MODE == "webhook":
+        from bot.webhook import run_webhook
+        run_webhook()
+        raise SystemExit(0)
+
+    if BOT_MODE != "polling":
+        print(f"[WARN] Неизвестный BOT_MODE={BOT_MODE!r}, работаем в режиме polling")
+
+    retry_delay = 1
     while True:
+        started = time.monotonic()
         try:
             telegram_bot.polling(
                 none_stop=True,
@@ -32,6 +48,10 @@ if __name__ == "__main__":
                 allowed_updates=["message", "callback_query", "document"],
             )
         except Exception as e:
+            # Долго проработали — сбой разовый, переподключаемся быстро; подряд идущие сбои — с нарастающей паузой
+            if time.monotonic() - started > 60:
+                retry_delay = 1
             print(f"❌ Ошибка подключения: {e}")
-            print("🔄 Перезапуск через 10 секунд...")
-            time.sleep(10)
+            print(f"🔄 Перезапуск через {retry_delay} секунд...")
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 30)
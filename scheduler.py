@@ -1,49 +1,236 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
 from zoneinfo import ZoneInfo
 from bot.core import bot
-from bot.utils.api import api_get_users_to_notify, api_get_schedule, api_get_teacher_schedule
-from bot.utils.schedule_utils import get_current_day, format_schedule_for_day, format_teacher_schedule_for_day
+from bot.utils.api import (
+    api_get_users_to_notify, api_get_schedule, api_health_stats, refresh_user_stats,
+    refresh_subscriber_index, schedule_version, subscriber_index,
+)
+from bot.utils.teacher_index import get_teacher_schedule
+from bot.utils.render_cache import render_cache_stats, render_schedule_for_day, render_teacher_schedule_for_day
 from bot.utils.fio_utils import fio_full_to_initials
-from config import TZ
+from bot.utils.delivery import delivery_engine
+from bot.utils.logger import log_error
+from config import (
+    TZ, DAYS_RU, STATS_RECONCILE_INTERVAL, SUBSCRIBER_REFRESH_INTERVAL,
+    DAILY_CATCHUP_MINUTES, DAILY_PRERENDER_MINUTES,
+)
 
-def send_daily_schedule():
-    # Получаем текущее время в формате HH:MM
-    now = datetime.now(ZoneInfo(TZ)).strftime("%H:%M")
-    
-    # Запрашиваем у API только тех, кому нужно отправить прямо сейчас[cite: 9]
-    users_to_notify = api_get_users_to_notify(now)
-    
-    if not users_to_notify:
-        return
+DAILY_HEADER = "📅 Ваше расписание на сегодня:\n\n"
+FETCH_WORKERS = 8
 
-    today = get_current_day()
-    if not today:
-        return
+def _daily_schedule_key(u: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """Ключ расписания, которое получит пользователь: ('teacher', ФИО) или ('group', группа)."""
+    if u.get("role") in ("teacher", "admin"):
+        return ("teacher", u.get("teacher_fio") or "")
+    group = u.get("group_name")
+    return ("group", group) if group else None
+
+def _fetch_schedule(key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+    kind, name = key
+    if kind == "teacher":
+        return get_teacher_schedule(fio_full_to_initials(name))
+    return api_get_schedule(name)
 
-    for u in users_to_notify:
+def _render_schedule(key: Tuple[str, str], sch: Optional[Dict[str, Any]], day: str) -> str:
+    kind, name = key
+    if kind == "teacher":
+        return render_teacher_schedule_for_day(name, sch or {}, day)
+    return render_schedule_for_day(name, sch or {}, day)
+
+def build_daily_batch(users: List[Dict[str, Any]], day: str) -> Tuple[List[Tuple[int, str, bool]], Dict[str, int]]:
+    """
+    Группирует получателей по расписанию, скачивает каждое расписание один раз
+    и форматирует текст один раз на (группа/преподаватель, день).
+    Возвращает список (user_id, текст, protect_content) и отчёт.
+    """
+    recipients: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    skipped = 0
+    for u in users:
+        key = _daily_schedule_key(u)
         uid = u.get("user_id")
-        role = u.get("role")
+        if key is None or not uid:
+            skipped += 1
+            continue
+        recipients[key].append(uid)
+
+    keys = list(recipients)
+    with ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(keys)))) as pool:
+        schedules = dict(zip(keys, pool.map(_fetch_schedule, keys)))
+
+    payloads: List[Tuple[int, str, bool]] = []
+    for key, uids in recipients.items():
+        text = DAILY_HEADER + _render_schedule(key, schedules.get(key), day)
+        protect = key[0] == "group"
+        payloads.extend((uid, text, protect) for uid in uids)
+
+    report = {
+        "recipients": len(payloads),
+        "distinct_fetches": len(keys),
+        "groups": sum(1 for k in keys if k[0] == "group"),
+        "teachers": sum(1 for k in keys if k[0] == "teacher"),
+        "skipped": skipped,
+    }
+    return payloads, report
+
+# Последняя обработанная минута рассылки (в TZ, без секунд)
+_last_tick: Optional[datetime] = None
+
+# Заранее подготовленные рассылки: минута → (версия расписания, тексты, отчёт).
+# За DAILY_PRERENDER_MINUTES до минуты с подписчиками расписания скачиваются и рендерятся в фоне,
+# а в саму минуту остаётся только отправить готовые сообщения.
+_prepared: Dict[datetime, Future] = {}
+_prepared_lock = Lock()
+_prerender_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="daily-prerender")
+
+def _daily_day(minute: datetime) -> Optional[str]:
+    weekday = minute.weekday()
+    return None if weekday == 6 else DAYS_RU[weekday]
+
+def _prepare_minute(minute: datetime):
+    version = schedule_version()
+    payloads, report = build_daily_batch(subscriber_index.bucket(minute.strftime("%H:%M")), _daily_day(minute))
+    return version, payloads, report
+
+def _schedule_prerender(now: datetime):
+    populated = set(subscriber_index.minutes())
+    with _prepared_lock:
+        for stale in [m for m in _prepared if m < now]:
+            _prepared.pop(stale).cancel()
+        for ahead in range(1, DAILY_PRERENDER_MINUTES + 1):
+            minute = now + timedelta(minutes=ahead)
+            if minute in _prepared or _daily_day(minute) is None or minute.strftime("%H:%M") not in populated:
+                continue
+            _prepared[minute] = _prerender_pool.submit(_prepare_minute, minute)
+
+def _take_prepared(minute: datetime, users: List[Dict[str, Any]], day: str) -> Tuple[List[Tuple[int, str, bool]], Dict[str, int]]:
+    """
+    Готовые тексты на минуту, сверенные с текущим составом корзины: отписавшиеся
+    за это время выкидываются, новые подписчики досчитываются сразу.
+    Если заготовки нет или расписание успели перезагрузить — батч собирается заново.
+    """
+    with _prepared_lock:
+        future = _prepared.pop(minute, None)
+    ready = None
+    if future is not None and not future.cancelled():
         try:
-            if role in ("teacher", "admin"):
-                teacher_fio = u.get("teacher_fio")
-                fio_key = fio_full_to_initials(teacher_fio or "")
-                sch = api_get_teacher_schedule(fio_key)
-                text = format_teacher_schedule_for_day(teacher_fio or "", sch or {}, today)
-                bot.send_message(uid, f"📅 Ваше расписание на сегодня:\n\n{text}")
-            else:
-                group = u.get("group_name")
-                if not group:
-                    continue
-                sch = api_get_schedule(group)
-                text = format_schedule_for_day(group, sch or {}, today)
-                bot.send_message(uid, f"📅 Ваше расписание на сегодня:\n\n{text}", protect_content=True)
+            ready = future.result()
         except Exception as e:
-            print(f"Ошибка отправки расписания пользователю {uid}: {e}")
+            log_error(f"_prepare_minute({minute:%H:%M})", e)
+    if ready is None or ready[0] != schedule_version():
+        return build_daily_batch(users, day)
+
+    _version, payloads, report = ready
+    current = {u.get("user_id") for u in users}
+    prepared = {uid for uid, _, _ in payloads}
+    payloads = [p for p in payloads if p[0] in current]
+    missing = [u for u in users if u.get("user_id") not in prepared]
+    if missing:
+        extra, extra_report = build_daily_batch(missing, day)
+        payloads.extend(extra)
+        report = {k: report[k] + extra_report[k] for k in report}
+    report["recipients"] = len(payloads)
+    return payloads, report
+
+def _dispatch_minute(minute: datetime, users: Optional[List[Dict[str, Any]]] = None):
+    """Рассылка подписчикам одной минуты; пустая минута не стоит ни одного запроса."""
+    day = _daily_day(minute)
+    if day is None:
+        return
+    stamp = minute.strftime("%H:%M")
+    if users is not None:
+        if not users:
+            return
+        payloads, report = build_daily_batch(users, day)
+    else:
+        users = subscriber_index.bucket(stamp)
+        if not users:
+            return
+        payloads, report = _take_prepared(minute, users, day)
+
+    def _report(run):
+        print(
+            f"[DAILY {stamp}] получателей: {report['recipients']}, отправлено: {run.sent}, ошибок: {run.failed}, "
+            f"повторов после 429: {run.retries}, за {run.elapsed:.1f} с; "
+            f"уникальных расписаний: {report['distinct_fetches']} "
+            f"(групп: {report['groups']}, преподавателей: {report['teachers']}), пропущено: {report['skipped']}"
+        )
+
+    def _error(uid, e):
+        print(f"Ошибка отправки расписания пользователю {uid}: {e}")
+
+    # Отправка идёт в пуле доставки — задание не блокирует следующую минуту
+    jobs = [
+        (uid, bot.send_message, (text,), {"protect_content": True} if protect else {})
+        for uid, text, protect in payloads
+    ]
+    delivery_engine.deliver(jobs, on_done=_report, on_error=_error)
+
+def send_daily_schedule():
+    global _last_tick
+    now = datetime.now(ZoneInfo(TZ)).replace(second=0, microsecond=0)
+
+    if not subscriber_index.loaded_at and not refresh_subscriber_index():
+        # Индекса ещё нет и API не отдало подписчиков — спрашиваем только текущую минуту, как раньше[cite: 9]
+        _dispatch_minute(now, api_get_users_to_notify(now.strftime("%H:%M")))
+        _last_tick = now
+        return
+
+    # Минуты, пропущенные из-за простоя или долгого тика, догоняются (не дальше окна догона)
+    start = now if _last_tick is None else max(_last_tick + timedelta(minutes=1), now - timedelta(minutes=DAILY_CATCHUP_MINUTES))
+    minute = start
+    while minute <= now:
+        _dispatch_minute(minute)
+        minute += timedelta(minutes=1)
+    if start < now:
+        print(f"[DAILY] догнали пропущенные минуты: {start:%H:%M}–{now:%H:%M}")
+    _last_tick = now
+    _schedule_prerender(now)
+
+def reconcile_user_stats():
+    try:
+        refresh_user_stats()
+    except Exception as e:
+        log_error("reconcile_user_stats", e)
+    # Заодно пишем в лог состояние клиента API и кэшей — по нему видно, помогают ли они
+    try:
+        health = api_health_stats()
+        print(
+            f"📊 API: цепь {health['breaker']['state']}, отклонено {health['breaker']['rejected']}, "
+            f"размыканий {health['breaker']['trips']}; склеено запросов {health['single_flight']['coalesced']} "
+            f"из {health['single_flight']['calls'] + health['single_flight']['coalesced']}"
+        )
+        print(f"📊 Кэш расписаний: {health['schedules']}; валидаторы: {health['validators']}")
+        print(f"📊 Кэш отрисовки: {render_cache_stats()}")
+    except Exception as e:
+        log_error("reconcile_user_stats: stats", e)
+
+def reload_subscriber_index():
+    try:
+        refresh_subscriber_index()
+    except Exception as e:
+        log_error("reload_subscriber_index", e)
 
 def attach_and_start_scheduler():
     scheduler = BackgroundScheduler()
     # Проверка каждую минуту[cite: 12]
-    scheduler.add_job(send_daily_schedule, "interval", minutes=1)
+    scheduler.add_job(
+        send_daily_schedule, "interval", minutes=1,
+        max_instances=1, coalesce=True, misfire_grace_time=30,
+    )
+    # Сверка счётчиков админской статистики; первый прогон сразу после старта
+    scheduler.add_job(
+        reconcile_user_stats, "interval", seconds=STATS_RECONCILE_INTERVAL,
+        next_run_time=datetime.now(ZoneInfo(TZ)), max_instances=1, coalesce=True,
+    )
+    # Полная перезагрузка индекса подписчиков; между перезагрузками он обновляется по api_update_user
+    scheduler.add_job(
+        reload_subscriber_index, "interval", seconds=SUBSCRIBER_REFRESH_INTERVAL,
+        next_run_time=datetime.now(ZoneInfo(TZ)), max_instances=1, coalesce=True,
+    )
     scheduler.start()
     return scheduler
\ No newline at end of file